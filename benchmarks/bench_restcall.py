@@ -0,0 +1,225 @@
+# MIT License
+# 
+# Copyright © 2022 Subhadip Ghosh
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the “Software”), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""
+Benchmarks for the restcall call path against a local HTTP server.
+
+    python benchmarks/bench_restcall.py --output bench-1.3.0.json
+    python benchmarks/bench_restcall.py --compare bench-1.3.0.json
+
+The results are stored as JSON so that they can be compared between versions.
+"""
+import argparse
+import contextlib
+import http.server
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+SRC_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, 'src'))
+sys.path.insert(0, SRC_ROOT)
+
+import requests
+from restcall import restcall
+
+SMALL_JSON = json.dumps({'description': 'A small command line script to invoke REST APIs'}).encode()
+LARGE_JSON = json.dumps({'items': [{'id': i, 'name': f'item-{i}', 'tags': ['a', 'b']}
+    for i in range(200000)]}).encode()
+BINARY = os.urandom(32 * 1024 * 1024)
+BODIES = {
+        '/json': ('application/json', SMALL_JSON),
+        '/large-json': ('application/json', LARGE_JSON),
+        '/binary': ('application/zip', BINARY),
+        }
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Small responses would otherwise wait for delayed ACKs
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        content_type, body = BODIES[self.path]
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _template(filepath:str, url:str):
+    restcall.generate_template(filepath, url=url, httpMethod='GET')
+
+
+def _timed(function, repeat:int) -> list:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def _stats(times:list, unit:int=1) -> dict:
+    return {
+            'median': statistics.median(times),
+            'min': min(times),
+            'perSecond': unit / statistics.median(times),
+            }
+
+
+def bench_calls(base_url:str, work_dir:str, calls:int) -> dict:
+    filepath = os.path.join(work_dir, 'get-json.json')
+    _template(filepath, base_url + '/json')
+    session = restcall.new_session()
+    with contextlib.redirect_stdout(io.StringIO()):
+        restcall_times = _timed(lambda: restcall.callrest(filepath, session=session), calls)
+    raw_times = _timed(lambda: session.get(base_url + '/json').content, calls)
+    session.close()
+    return {
+            'callrest': _stats(restcall_times),
+            'requests': _stats(raw_times),
+            # What restcall adds on top of the plain requests call
+            'overhead': statistics.median(restcall_times) - statistics.median(raw_times),
+            }
+
+
+def _response(content_type:str, body:bytes) -> requests.Response:
+    res = requests.Response()
+    res.status_code = 200
+    res.headers['Content-Type'] = content_type
+    res.raw = io.BytesIO(body)
+    res.encoding = 'utf-8'
+    return res
+
+
+def bench_responsedata(work_dir:str, repeat:int) -> dict:
+    # Response handling only, without the network
+    results = {}
+    filepath = os.path.join(work_dir, 'get-body.json')
+    for name, (content_type, body) in [('largeJson', BODIES['/large-json']),
+            ('binary', BODIES['/binary'])]:
+        template = {'resFile': ''}
+        with contextlib.redirect_stdout(io.StringIO()):
+            times = _timed(lambda: restcall._get_responsedata(_response(content_type, body),
+                template, filepath), repeat)
+        results[name] = {**_stats(times), 'megabytesPerSecond': len(body) / 1e6 / statistics.median(times)}
+    return results
+
+
+def bench_uncurlify(work_dir:str, repeat:int) -> dict:
+    curl_filepath = os.path.join(work_dir, 'curl-command.txt')
+    with open(curl_filepath, 'w') as f:
+        f.write("curl -XPOST -H 'Authorization: Bearer dGVzdC10b2tlbgo=' "
+                "-H 'Content-Type: application/json' -d '{\"key\": \"value\"}' 'http://restcall.org/'")
+    filepath = os.path.join(work_dir, 'post-uncurlify.json')
+    return _stats(_timed(lambda: restcall.uncurlify(curl_filepath, filepath), repeat))
+
+
+def bench_cold_start(base_url:str, work_dir:str, repeat:int) -> dict:
+    filepath = os.path.join(work_dir, 'get-cold.json')
+    _template(filepath, base_url + '/json')
+    env = {**os.environ, 'PYTHONPATH': SRC_ROOT}
+
+    def run(*args):
+        subprocess.run([sys.executable, '-m', 'restcall', '--no-daemon', *args],
+                env=env, check=True, stdout=subprocess.DEVNULL)
+    return {
+            'template': _stats(_timed(lambda: run('-t', os.path.join(work_dir, 'get-new.json')), repeat)),
+            'call': _stats(_timed(lambda: run(filepath), repeat)),
+            }
+
+
+def run_benchmarks(quick:bool=False) -> dict:
+    repeat = 3 if quick else 10
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = 'http://127.0.0.1:{}'.format(server.server_port)
+    work_dir = tempfile.mkdtemp()
+    try:
+        results = {
+                'calls': bench_calls(base_url, work_dir, 50 if quick else 500),
+                'responseData': bench_responsedata(work_dir, repeat),
+                'uncurlify': bench_uncurlify(work_dir, repeat * 10),
+                'coldStart': bench_cold_start(base_url, work_dir, repeat),
+                }
+    finally:
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(work_dir)
+
+    return {
+            'version': restcall.print_version(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'timestamp': time.time(),
+            'results': results,
+            }
+
+
+def _flatten(results:dict, prefix:str='') -> dict:
+    flat = {}
+    for k, v in results.items():
+        if isinstance(v, dict):
+            flat.update(_flatten(v, prefix + k + '.'))
+        else:
+            flat[prefix + k] = v
+    return flat
+
+
+def compare(baseline:dict, current:dict):
+    baseline_results = _flatten(baseline['results'])
+    print(f'Comparing with {baseline["version"]} (ratio of current to baseline)')
+    for name, value in _flatten(current['results']).items():
+        if name.endswith('.median') and baseline_results.get(name):
+            print(f'{name:40} {value:12.6f}s {value / baseline_results[name]:8.2f}x')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark restcall')
+    parser.add_argument('-o', '--output', help='file to store the results in')
+    parser.add_argument('--compare', help='results of an earlier run to compare with')
+    parser.add_argument('--quick', action='store_true', help='run fewer iterations')
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.quick)
+    output = args.output or f'bench-{report["version"]}.json'
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=4)
+    print(f'Results stored in {output}')
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == '__main__':
+    main()
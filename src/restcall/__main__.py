@@ -19,46 +19,253 @@
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
-from restcall import restcall
+from restcall import daemon
 import sys
 import argparse
 import traceback
-from requests.exceptions import ConnectionError
+
+
+class _VersionAction(argparse.Action):
+    # Looks up the version only when it is asked for
+
+    def __init__(self, option_strings, dest, **kwargs):
+        super().__init__(option_strings, dest, nargs=0, **kwargs)
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        from restcall import restcall
+        print(restcall.print_version())
+        parser.exit()
+
+
+def _hedge(value:str):
+    # Seconds, or a percentile like p95
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return value
+
 
 def _main(argv: list):
+    # Imported here so that forwarding to a running daemon stays cheap
+    from restcall import restcall
+    from restcall import batch
+    from restcall import loadtest
+    from restcall import aio
+    from restcall import workflow
+    from restcall import datarun
+    from restcall import replay
+    from restcall import store
+    from restcall import curlify
+    from restcall import importer
+    from restcall import download
+    from restcall import sink
+    from restcall import metrics
+    from restcall import netcache
+    import asyncio
+    from restcall import tokencache
+    from restcall import timing
+    from restcall import httpcache
+    from restcall import retry
+    from requests.exceptions import ConnectionError, Timeout
+
     parser=argparse.ArgumentParser(description='Make restcalls!',
                                    usage=restcall.usage())
-    parser.add_argument('filepath', help='path to the restcall template')
-    parser.add_argument('-v', '--version', action='version', version=restcall.print_version())
+    parser.add_argument('filepath', nargs='?', help='path to the restcall template')
+    parser.add_argument('-v', '--version', action=_VersionAction, help="show program's version number and exit")
     parser.add_argument('-t', '--template', action='store_true',
             help='generate restcall template')
     parser.add_argument('-c', '--curlify', action='store_true',
             help='generate curl command for the REST call')
+    parser.add_argument('--import', type=str, dest='import_filepath',
+            help='generate restcall templates in the directory given as filepath from a HAR file or a file with many curl commands')
+    parser.add_argument('--curl-export', type=str, dest='curl_export_filepath',
+            help='write the curl commands of all the templates in the directory or matching the glob pattern given as filepath to this file, without making the calls')
+    parser.add_argument('--curl-spill-size', type=int,
+            help='with -c, write request bodies larger than this many kilobytes to a temp file instead of the command. With --curl-export, embed them in the script.')
     parser.add_argument('-u', '--uncurlify', type=str, dest='curl_command_filepath',
                         help='generate restcall template from a curl command. Pass the file path containing the curl command.')
+    parser.add_argument('-b', '--batch', action='store_true',
+            help='run all the templates in the directory or matching the glob pattern given as filepath')
+    parser.add_argument('-w', '--workers', type=int,
+            help='number of concurrent calls in batch, workflow and data mode. Default is 8, or 1000 with --async. With --import, the number of conversion processes.')
+    parser.add_argument('--adaptive', action='store_true',
+            help='adapt the number of concurrent calls in batch mode to the latency and to 429/503 responses, up to --workers')
+    parser.add_argument('--rps', type=float,
+            help='maximum number of requests per second to each host in batch mode')
+    parser.add_argument('--workflow', action='store_true',
+            help='run the workflow file given as filepath')
+    parser.add_argument('--data', type=str, dest='data_filepath',
+            help='call the template once for every row of this CSV or NDJSON file, filling in its {{column}} placeholders')
+    parser.add_argument('--async', action='store_true', dest='use_async',
+            help='make the calls with the asyncio engine. Suited for batches with very high fan-out.')
+    parser.add_argument('--limit-per-host', type=int, default=100,
+            help='maximum number of connections per host with --async. Default is 100.')
+    parser.add_argument('--load', action='store_true',
+            help='load test the endpoint by replaying the template')
+    parser.add_argument('--requests', type=int, dest='load_requests',
+            help='number of requests to send in load test mode. Default is 100 unless --duration is given.')
+    parser.add_argument('--concurrency', type=int, default=1,
+            help='number of concurrent requests in load test mode. Default is 1.')
+    parser.add_argument('--duration', type=float,
+            help='number of seconds to run the load test for')
+    parser.add_argument('--timeout', type=float,
+            help='seconds to wait for the connection and for each read, for templates without reqTimeout')
+    parser.add_argument('--retries', type=int, default=0,
+            help='number of retries on errors, 429 and 5xx, for templates without reqRetries. Default is 0.')
+    parser.add_argument('--hedge', type=str,
+            help='seconds, or a latency percentile like p95, after which a duplicate idempotent call is sent, for templates without reqHedge')
+    parser.add_argument('--compact', action='store_true',
+            help='write the response file without indentation')
+    parser.add_argument('--raw-json', action='store_true',
+            help='save JSON response bodies as received to a separate file instead of the response file')
+    parser.add_argument('--download-parts', type=int,
+            help='download large bodies saved to files over this many parallel range requests, for templates without resDownloadParts')
+    parser.add_argument('--store', type=str,
+            help='write the response bodies saved to files once to this content-addressed store and hardlink them')
+    parser.add_argument('--gc', action='store_true',
+            help='remove the bodies in the --store directory that no file links to any more')
+    parser.add_argument('--sink', type=str,
+            help='append the results to this SQLite database (.sqlite, .db) or NDJSON file instead of writing a response file per call')
+    parser.add_argument('--metrics-file', type=str,
+            help='write the call counts and latency histograms to this OpenMetrics textfile')
+    parser.add_argument('--statsd', type=str,
+            help='send the call counts and latencies to this StatsD host:port over UDP')
+    parser.add_argument('--dns-cache', action='store_true',
+            help='reuse the resolved addresses of hosts, also in later runs, for --dns-ttl seconds')
+    parser.add_argument('--dns-ttl', type=float, default=60,
+            help='seconds the resolved addresses are reused for with --dns-cache. Default is 60.')
+    parser.add_argument('--tls-resume', action='store_true',
+            help='resume TLS sessions on new connections to the same server and report the resumed handshakes')
+    parser.add_argument('--trace', type=str, dest='trace_filepath',
+            help='append the per-phase network timings of every call to this file as JSON lines')
+    cache = parser.add_mutually_exclusive_group()
+    cache.add_argument('--cache', action='store_true',
+            help='cache the responses of GET calls and revalidate them on later calls')
+    cache.add_argument('--no-cache', action='store_true',
+            help='do not use the response cache, even for templates with resCache set')
+    parser.add_argument('--cache-size', type=int, default=httpcache.DEFAULT_MAX_SIZE // (1024 * 1024),
+            help='maximum size of the response cache in megabytes. Default is 256.')
+    parser.add_argument('--no-token-cache', action='store_true',
+            help='generate a new bearer token for every call instead of reusing cached tokens')
+    parser.add_argument('--replay', action='store_true',
+            help='serve the responses recorded in the -res.json files under the directory given as filepath')
+    parser.add_argument('--port', type=int, default=8080,
+            help='port of the --replay server. Default is 8080.')
+    parser.add_argument('--host', default='127.0.0.1',
+            help='address of the --replay server. Default is 127.0.0.1.')
+    parser.add_argument('--serve', action='store_true',
+            help='run a daemon that keeps connections, templates and tokens warm. Later calls are forwarded to it.')
+    parser.add_argument('--no-daemon', action='store_true',
+            help='make the call in this process even when a daemon is running')
 
     args = parser.parse_args(argv)
     filepath = args.filepath
+    if args.serve:
+        daemon.serve()
+        return
+    store.directory = args.store
+    download.parts = args.download_parts
+    curlify.spill_size = args.curl_spill_size * 1024 if args.curl_spill_size is not None else None
+    if args.gc:
+        if not args.store:
+            parser.error('--gc requires --store')
+        removed, size = store.gc()
+        print(f'Removed {removed} unreferenced bodies, {size/1024:.3f}K')
+        return
+    if filepath is None:
+        parser.error('the following arguments are required: filepath')
+    if (args.adaptive or args.rps) and (not args.batch or args.use_async
+            or args.workflow or args.data_filepath):
+        # Only the batch runner on worker threads limits its calls
+        parser.error('--adaptive and --rps require -b without --async, --workflow or --data')
+    tokencache.enabled = not args.no_token_cache
+    restcall.compact_output = args.compact
+    restcall.raw_json_output = args.raw_json
+    timing.trace_filepath = args.trace_filepath
+    retry.timeout = args.timeout
+    retry.retries = args.retries
+    retry.hedge = _hedge(args.hedge)
+    httpcache.enabled = True if args.cache else False if args.no_cache else None
+    httpcache.max_size = args.cache_size * 1024 * 1024
     if args.template:
         restcall.generate_template(filepath)
     elif args.curl_command_filepath:
         restcall.uncurlify(args.curl_command_filepath, filepath)
+    elif args.import_filepath:
+        importer.import_file(args.import_filepath, filepath, args.workers)
+    elif args.curl_export_filepath:
+        batch.export_curl(filepath, args.curl_export_filepath)
     else:
+        # Closed in the finally block below, which writes the pending results
+        sink.current = sink.open_sink(args.sink) if args.sink else None
+        metrics.textfile_path = args.metrics_file
+        netcache.dns_ttl = args.dns_ttl if args.dns_cache else None
+        netcache.tls_resume = args.tls_resume
+        netcache.reset_stats()
+        metrics.statsd = metrics.StatsdClient(args.statsd) if args.statsd else None
         try:
-            restcall.callrest(filepath, args.curlify)
+            if args.replay:
+                replay.serve(filepath, args.host, args.port)
+            elif args.load:
+                loadtest.run_load(filepath, args.load_requests, args.concurrency,
+                        args.duration)
+            elif args.workflow:
+                summary = workflow.run_workflow(filepath, args.workers or 8, args.curlify)
+                if summary['failed']:
+                    sys.exit(1)
+            elif args.data_filepath:
+                summary = datarun.run_data(filepath, args.data_filepath, args.workers or 8)
+                if summary['failed']:
+                    sys.exit(1)
+            elif args.batch and args.use_async:
+                summary = asyncio.run(aio.callrest_batch_async(filepath,
+                    args.workers or 1000, args.limit_per_host, args.curlify))
+                if summary['failed']:
+                    sys.exit(1)
+            elif args.batch:
+                summary = batch.callrest_batch(filepath, args.workers or 8, args.curlify,
+                        args.adaptive, args.rps)
+                if summary['failed']:
+                    sys.exit(1)
+            elif args.use_async:
+                asyncio.run(aio.callrest_async(filepath, args.curlify))
+            else:
+                restcall.callrest(filepath, args.curlify)
         except KeyboardInterrupt:
             print("\nWARN: KeyboardInterrupt caught. Exiting restcall.")
             sys.exit(1)
         except ConnectionError as ce:
             print("\nWARN: Restcall failed due to ConnectionError:" + str(ce))
             sys.exit(1)
+        except Timeout as te:
+            print("\nWARN: Restcall failed due to Timeout:" + str(te))
+            sys.exit(1)
+        except restcall.TemplateError as te:
+            print(te)
+            sys.exit(1)
         except Exception as e:
             print("\nERROR: Restcall failed due to unknown errors. Here are the error details.")
             traceback.print_exc()
             sys.exit(1)
+        finally:
+            if sink.current:
+                sink.current.close()
+                sink.current = None
+            metrics.flush()
+            if args.dns_cache or args.tls_resume:
+                print(netcache.report())
+            if metrics.statsd:
+                metrics.statsd.close()
+                metrics.statsd = None
 
 def main():
-    _main(sys.argv[1:])
+    argv = sys.argv[1:]
+    # The replay server runs in the foreground, it would block the daemon
+    if not {'--serve', '--no-daemon', '--replay'} & set(argv):
+        exit_code = daemon.forward(argv)
+        if exit_code is not None:
+            sys.exit(exit_code)
+    _main(argv)
 
 if __name__=='__main__':
     main()
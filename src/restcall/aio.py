@@ -0,0 +1,372 @@
+# MIT License
+# 
+# Copyright © 2022 Subhadip Ghosh
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the “Software”), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import asyncio
+import ssl
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from datetime import timedelta
+from typing import Final
+from urllib.parse import urljoin, urlsplit
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from restcall import restcall
+from restcall import batch
+from restcall import compression
+from restcall import retry
+from restcall import metrics
+
+DEFAULT_PORTS: Final = {'http': 80, 'https': 443}
+REDIRECT_STATUSES: Final = [301, 302, 303, 307, 308]
+MAX_REDIRECTS: Final = 30
+# Bodies larger than this are spooled to a temp file while they are read
+SPOOL_SIZE: Final = 1024 * 1024
+
+
+class _Connection:
+
+    def __init__(self, reader:asyncio.StreamReader, writer:asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.reusable = False
+        self.reused = False
+
+    def close(self):
+        self.writer.close()
+
+
+class ConnectionPool:
+    """
+    Keeps keep-alive connections per host and caps the number of connections
+    open to each host at `limit_per_host`. Like the requests based calls, the
+    SSL certificates are not verified.
+    """
+
+    def __init__(self, limit_per_host:int=100):
+        self.limit_per_host = limit_per_host
+        self.opened = 0
+        self._idle = {}
+        self._semaphores = {}
+        self._ssl_context = ssl.create_default_context()
+        self._ssl_context.check_hostname = False
+        self._ssl_context.verify_mode = ssl.CERT_NONE
+
+    def _semaphore(self, key:tuple) -> asyncio.Semaphore:
+        if key not in self._semaphores:
+            self._semaphores[key] = asyncio.Semaphore(self.limit_per_host)
+        return self._semaphores[key]
+
+    def _take_idle(self, key:tuple):
+        idle = self._idle.get(key, [])
+        while idle:
+            conn = idle.pop()
+            if not conn.writer.is_closing() and not conn.reader.at_eof():
+                conn.reused = True
+                return conn
+            conn.close()
+        return None
+
+    async def _open(self, scheme:str, host:str, port:int) -> _Connection:
+        reader, writer = await asyncio.open_connection(host, port,
+                ssl=self._ssl_context if scheme == 'https' else None,
+                server_hostname=host if scheme == 'https' else None)
+        self.opened += 1
+        return _Connection(reader, writer)
+
+    @asynccontextmanager
+    async def connection(self, scheme:str, host:str, port:int, fresh:bool=False):
+        key = (scheme, host, port)
+        async with self._semaphore(key):
+            conn = None if fresh else self._take_idle(key)
+            if conn is None:
+                conn = await self._open(scheme, host, port)
+            try:
+                yield conn
+            finally:
+                if conn.reusable:
+                    conn.reusable = False
+                    self._idle.setdefault(key, []).append(conn)
+                else:
+                    conn.close()
+
+    def close(self):
+        for idle in self._idle.values():
+            for conn in idle:
+                conn.close()
+        self._idle.clear()
+
+
+def _prepare(template:dict) -> requests.PreparedRequest:
+    # Building the headers may generate a bearer token, which is a blocking
+    # call, so this runs in a worker thread
+    # File payloads are streamed from the open file while sending
+    data = restcall._get_payload(template)
+    req_headers = restcall._get_reqheaders(template)
+    data, _ = restcall._compress_payload(template, data, req_headers)
+    with requests.Session() as session:
+        # Only ask for the encodings the body can be decoded from
+        session.headers['Accept-Encoding'] = ', '.join(compression.response_encodings())
+        return session.prepare_request(requests.Request(template['httpMethod'],
+            template['url'],
+            headers=restcall._content_headers(req_headers, data),
+            data=data))
+
+
+async def _write_body(writer:asyncio.StreamWriter, body):
+    if body is None:
+        return
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    if isinstance(body, bytes):
+        writer.write(body)
+    elif hasattr(body, 'read'):
+        while chunk := body.read(restcall.CHUNK_SIZE):
+            writer.write(chunk)
+            await writer.drain()
+    else:
+        for chunk in body:
+            if chunk:
+                writer.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+                await writer.drain()
+        writer.write(b'0\r\n\r\n')
+    await writer.drain()
+
+
+async def _send_request(conn:_Connection, request:requests.PreparedRequest):
+    url = urlsplit(request.url)
+    lines = [f'{request.method} {request.path_url} HTTP/1.1', f'Host: {url.netloc}']
+    lines += [f'{k}: {v}' for k, v in request.headers.items() if k.lower() != 'host']
+    body = request.body
+    if (body is not None and not isinstance(body, (str, bytes)) and not hasattr(body, 'read')
+            and 'Transfer-Encoding' not in request.headers):
+        lines.append('Transfer-Encoding: chunked')
+    conn.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+    await _write_body(conn.writer, body)
+
+
+async def _read_headers(reader:asyncio.StreamReader) -> tuple:
+    status_line = await reader.readline()
+    if not status_line:
+        raise requests.exceptions.ConnectionError('Connection closed by the server')
+    version, status, *reason = status_line.decode('latin-1').rstrip('\r\n').split(' ', 2)
+    headers = CaseInsensitiveDict()
+    while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+        name, _, value = line.decode('latin-1').partition(':')
+        name, value = name.strip(), value.strip()
+        headers[name] = headers[name] + ', ' + value if name in headers else value
+    return (version, int(status), reason[0] if reason else '', headers)
+
+
+def _decoder(headers) -> tuple:
+    encoding = headers.get('Content-Encoding', '').lower()
+    if encoding in compression.response_encodings():
+        return compression.decompressor(encoding)
+    return (None, None)
+
+
+async def _copy(reader:asyncio.StreamReader, size:int, write):
+    remaining = size
+    while remaining:
+        chunk = await reader.read(min(remaining, restcall.CHUNK_SIZE))
+        if not chunk:
+            raise asyncio.IncompleteReadError(b'', size)
+        write(chunk)
+        remaining -= len(chunk)
+
+
+async def _read_body(conn:_Connection, method:str, status:int, headers, out):
+    reader = conn.reader
+    if method == 'HEAD' or status in (204, 304) or status < 200:
+        return
+    decompress, flush = _decoder(headers)
+
+    def write(chunk:bytes):
+        out.write(decompress(chunk) if decompress else chunk)
+
+    if 'chunked' in headers.get('Transfer-Encoding', '').lower():
+        while (size := int((await reader.readline()).split(b';')[0], 16)) > 0:
+            await _copy(reader, size, write)
+            await reader.readline()
+        # Skip the trailers
+        while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+            pass
+    elif 'Content-Length' in headers:
+        await _copy(reader, int(headers['Content-Length']), write)
+    else:
+        while chunk := await reader.read(restcall.CHUNK_SIZE):
+            write(chunk)
+    if flush:
+        out.write(flush())
+
+
+async def _exchange(pool:ConnectionPool, request:requests.PreparedRequest) -> requests.Response:
+    url = urlsplit(request.url)
+    port = url.port or DEFAULT_PORTS[url.scheme]
+    fresh = False
+    while True:
+        conn = None
+        start = time.perf_counter()
+        try:
+            async with pool.connection(url.scheme, url.hostname, port, fresh) as conn:
+                await _send_request(conn, request)
+                while True:
+                    version, status, reason, headers = await _read_headers(conn.reader)
+                    # Skip the interim responses like 100 Continue
+                    if not 100 <= status < 200:
+                        break
+                elapsed = time.perf_counter() - start
+                # Large bodies are not held in memory before they are saved
+                spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+                try:
+                    await _read_body(conn, request.method, status, headers, spool)
+                except BaseException:
+                    spool.close()
+                    raise
+                # Bodies delimited by closing the connection leave it at EOF
+                conn.reusable = (version == 'HTTP/1.1' and not conn.reader.at_eof()
+                        and headers.get('Connection', '').lower() != 'close')
+                break
+        except (OSError, asyncio.IncompleteReadError, requests.exceptions.ConnectionError) as e:
+            # An idle connection may have been closed by the server. Retry once
+            # on a new connection if the body can be sent again.
+            body = request.body
+            resendable = (body is None or isinstance(body, (str, bytes))
+                    or (hasattr(body, 'seek') and body.seekable()))
+            if conn is not None and conn.reused and resendable:
+                if hasattr(body, 'seek'):
+                    body.seek(0)
+                fresh = True
+                continue
+            if isinstance(e, requests.exceptions.ConnectionError):
+                raise
+            raise requests.exceptions.ConnectionError(e, request=request)
+
+    res = requests.Response()
+    res.status_code = status
+    res.reason = reason
+    res.headers = headers
+    # requests reads the spooled body like the body of a streamed call
+    spool.seek(0)
+    res.raw = spool
+    res.encoding = get_encoding_from_headers(headers)
+    res.url = request.url
+    res.request = request
+    res.elapsed = timedelta(seconds=elapsed)
+    return res
+
+
+async def _do_call_async(template:dict, pool:ConnectionPool) -> requests.Response:
+    request = await asyncio.to_thread(_prepare, template)
+    body = request.body
+    timeout = retry.get_timeout(template)
+    # A [connect, read] pair bounds the whole exchange
+    if isinstance(timeout, tuple):
+        timeout = sum(timeout)
+    try:
+        for _ in range(MAX_REDIRECTS):
+            try:
+                res = await asyncio.wait_for(_exchange(pool, request), timeout)
+            except asyncio.TimeoutError as e:
+                raise requests.exceptions.Timeout(e, request=request)
+            if res.status_code not in REDIRECT_STATUSES or 'Location' not in res.headers:
+                return res
+            res.close()
+            request = request.copy()
+            request.url = urljoin(request.url, res.headers['Location'])
+            if res.status_code == 303 or (res.status_code in (301, 302)
+                    and request.method == 'POST'):
+                request.method = 'GET'
+                request.body = None
+                for header in ('Content-Length', 'Content-Type', 'Transfer-Encoding'):
+                    request.headers.pop(header, None)
+        raise requests.exceptions.TooManyRedirects(
+                f'Exceeded {MAX_REDIRECTS} redirects.', response=res)
+    finally:
+        restcall._close_payload(body)
+
+
+async def callrest_async(filepath:str, curlify:bool=False,
+        pool:ConnectionPool=None) -> dict[str,object]:
+    """
+    Asynchronous counterpart of `restcall.callrest`. Calls sharing a pool
+    reuse its connections. The calls are timed out, retried and hedged like
+    the regular calls.
+    """
+    template = restcall.load_template(filepath)
+    if template['httpMethod'] not in restcall.HTTP_METHODS:
+        raise NotImplementedError('HTTP method not supported')
+
+    own_pool = pool is None
+    pool = pool or ConnectionPool()
+    start = time.perf_counter()
+    # Stays None when the call fails
+    status = None
+    try:
+        res = await retry.call_async(template, lambda t: _do_call_async(t, pool))
+        result = await asyncio.to_thread(restcall._store_response, res, template,
+                filepath, curlify)
+        status = result['resStatus']
+        return result
+    finally:
+        metrics.observe(filepath, template, status, time.perf_counter() - start)
+        if own_pool:
+            pool.close()
+
+
+async def _run_one(filepath:str, pool:ConnectionPool, semaphore:asyncio.Semaphore,
+        curlify:bool):
+    async with semaphore:
+        try:
+            template = await callrest_async(filepath, curlify, pool)
+            return (filepath, template['resStatus'], None)
+        except Exception as e:
+            return (filepath, None, e)
+
+
+async def callrest_batch_async(pattern:str, concurrency:int=1000,
+        limit_per_host:int=100, curlify:bool=False) -> dict:
+    """
+    Runs all the templates matching `pattern` with at most `concurrency`
+    requests in flight and `limit_per_host` connections to each host.
+    """
+    filepaths = batch.collect_templates(pattern)
+    pool = ConnectionPool(limit_per_host)
+    semaphore = asyncio.Semaphore(concurrency)
+    statuses = {}
+    failures = []
+
+    start = time.perf_counter()
+    try:
+        for filepath, status, error in await asyncio.gather(
+                *(_run_one(f, pool, semaphore, curlify) for f in filepaths)):
+            if error is not None:
+                failures.append((filepath, error))
+            else:
+                statuses[status] = statuses.get(status, 0) + 1
+    finally:
+        pool.close()
+    elapsed = time.perf_counter() - start
+
+    summary = batch.summarize(len(filepaths), statuses, failures, elapsed)
+    batch.print_summary(summary)
+    return summary
@@ -0,0 +1,150 @@
+# MIT License
+# 
+# Copyright © 2022 Subhadip Ghosh
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the “Software”), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import glob
+import time
+from os import path
+from typing import Final
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from restcall import restcall
+from restcall.limiter import AdaptiveLimiter, RateLimiter
+
+# The response files, the JSON bodies saved by --raw-json and the load test
+# reports written next to the templates
+OUTPUT_SUFFIXES: Final = ('-res.json', '-body.json', '-load.json')
+
+
+def collect_templates(pattern:str) -> list:
+    """
+    Returns the restcall templates in a directory or matching a glob pattern.
+    The files restcall writes next to the templates are skipped.
+    """
+    if path.isdir(pattern):
+        pattern = path.join(pattern, '*.json')
+    return sorted(f for f in glob.glob(pattern, recursive=True)
+            if f.endswith('.json') and not f.endswith(OUTPUT_SUFFIXES))
+
+
+def _run_one(filepath:str, session, curlify:bool, limiter:AdaptiveLimiter=None,
+        rate_limiter:RateLimiter=None):
+    status = None
+    url = ''
+    start = time.perf_counter()
+    if limiter:
+        limiter.acquire()
+    try:
+        template = restcall.load_template(filepath)
+        url = template['url']
+        if rate_limiter:
+            rate_limiter.wait(url)
+        start = time.perf_counter()
+        status = restcall.call_template(template, filepath, curlify, session)['resStatus']
+        return (filepath, status, None)
+    except Exception as e:
+        return (filepath, None, e)
+    finally:
+        if limiter:
+            limiter.release(time.perf_counter() - start, status, url)
+
+
+def callrest_batch(pattern:str, workers:int=8, curlify:bool=False,
+        adaptive:bool=False, rps:float=None) -> dict:
+    """
+    Runs all the templates matching `pattern` on a pool of `workers` threads.
+    The calls share one session, so connections are reused per host. Every
+    template still gets its own `-res.json` file.
+
+    With `adaptive` the number of concurrent calls adapts to the latency and
+    the 429 and 503 responses, up to `workers`. `rps` caps the requests per
+    second sent to each host.
+    """
+    filepaths = collect_templates(pattern)
+    session = restcall.new_session(workers)
+    limiter = AdaptiveLimiter(workers) if adaptive else None
+    rate_limiter = RateLimiter(rps) if rps else None
+    statuses = {}
+    failures = []
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_run_one, f, session, curlify, limiter, rate_limiter)
+                for f in filepaths]
+        for future in as_completed(futures):
+            filepath, status, error = future.result()
+            if error is not None:
+                failures.append((filepath, error))
+            else:
+                statuses[status] = statuses.get(status, 0) + 1
+    elapsed = time.perf_counter() - start
+    session.close()
+
+    summary = summarize(len(filepaths), statuses, failures, elapsed)
+    if limiter:
+        summary['concurrency'] = {'peak': limiter.peak, 'final': int(limiter.limit)}
+    print_summary(summary)
+    return summary
+
+
+def export_curl(pattern:str, output_filepath:str) -> int:
+    """
+    Writes the curl commands of all the templates matching `pattern` to one
+    shell script, without making the calls. Bodies are embedded in the script
+    rather than written to temp files. Returns the number of commands.
+    """
+    count = 0
+    with open(output_filepath, 'w') as out:
+        out.write('#!/bin/sh\n')
+        for filepath in collect_templates(pattern):
+            try:
+                command = restcall.curlify_template(restcall.load_template(filepath), embed=True)
+            except Exception as e:
+                print(f'WARN: Skipping {filepath}: {e!r}')
+                continue
+            out.write(f'\n# {filepath}\n{command}\n')
+            count += 1
+    print(f'Exported {count} curl commands to {output_filepath}')
+    return count
+
+
+def summarize(total:int, statuses:dict, failures:list, elapsed:float) -> dict:
+    return {
+            'total': total,
+            'succeeded': total - len(failures),
+            'failed': len(failures),
+            'statuses': statuses,
+            'time': elapsed,
+            'throughput': total / elapsed if elapsed else 0.0,
+            'failures': sorted((f, repr(e)) for f, e in failures),
+            }
+
+
+def print_summary(summary:dict):
+    print('\nBatch finished: {} templates in {:.3f}s ({:.2f} calls/s), succeeded: {}, failed: {}'.format(
+        summary['total'], summary['time'], summary['throughput'],
+        summary['succeeded'], summary['failed']))
+    if summary['statuses']:
+        print('Response statuses: ' + ', '.join(f'{s}: {c}'
+            for s, c in sorted(summary['statuses'].items())))
+    if 'concurrency' in summary:
+        print('Adaptive concurrency reached: {}, final: {}'.format(
+            summary['concurrency']['peak'], summary['concurrency']['final']))
+    for filepath, error in summary['failures']:
+        print(f'FAILED: {filepath}: {error}')
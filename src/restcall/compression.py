@@ -0,0 +1,135 @@
+# MIT License
+# 
+# Copyright © 2022 Subhadip Ghosh
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the “Software”), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import zlib
+from typing import Final
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CHUNK_SIZE: Final = 64 * 1024
+
+# Command line compressors matching the content encodings, for curl commands
+COMMANDS: Final = {'gzip': 'gzip -c', 'br': 'brotli -c', 'zstd': 'zstd -c'}
+
+
+def request_encodings() -> list:
+    """
+    Returns the content encodings request bodies can be compressed with.
+    """
+    return ['gzip'] + (['br'] if brotli else []) + (['zstd'] if zstandard else [])
+
+
+def _compressor(encoding:str):
+    if encoding == 'gzip':
+        compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+        return (compressor.compress, compressor.flush)
+    if encoding == 'br' and brotli:
+        compressor = brotli.Compressor()
+        return (compressor.process, compressor.finish)
+    if encoding == 'zstd' and zstandard:
+        compressor = zstandard.ZstdCompressor().compressobj()
+        return (compressor.compress, compressor.flush)
+    raise ValueError(f'Unsupported request compression: {encoding}. '
+            f'Supported: {", ".join(request_encodings())}')
+
+
+def response_encodings() -> list:
+    """
+    Returns the content encodings response bodies can be decoded from.
+    """
+    return ['gzip', 'deflate'] + (['br'] if brotli else []) + (['zstd'] if zstandard else [])
+
+
+class _Inflater:
+
+    def __init__(self):
+        self._decompressor = None
+
+    def decompress(self, chunk:bytes) -> bytes:
+        if self._decompressor is None:
+            # Servers send deflate bodies with or without the zlib header
+            self._decompressor = zlib.decompressobj()
+            try:
+                return self._decompressor.decompress(chunk)
+            except zlib.error:
+                self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        return self._decompressor.decompress(chunk)
+
+    def flush(self) -> bytes:
+        return self._decompressor.flush() if self._decompressor else b''
+
+
+def decompressor(encoding:str):
+    """
+    Returns the functions decoding a response body of one of the
+    `response_encodings()` chunk by chunk and flushing the end of it.
+    """
+    if encoding == 'gzip':
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    elif encoding == 'deflate':
+        decompressor = _Inflater()
+    elif encoding == 'br' and brotli:
+        decompressor = brotli.Decompressor()
+        return (decompressor.process, lambda: b'')
+    elif encoding == 'zstd' and zstandard:
+        decompressor = zstandard.ZstdDecompressor().decompressobj()
+    else:
+        raise ValueError(f'Unsupported response encoding: {encoding}')
+    return (decompressor.decompress, decompressor.flush)
+
+
+def _compress_stream(f, encoding:str):
+    with f:
+        yield from _compress_chunks(iter(lambda: f.read(CHUNK_SIZE), b''), encoding)
+
+
+def _compress_chunks(chunks, encoding:str):
+    compress, flush = _compressor(encoding)
+    for chunk in chunks:
+        if compressed := compress(chunk):
+            yield compressed
+    yield flush()
+
+
+def compress(data, encoding:str):
+    """
+    Compresses a request body. Text and bytes are compressed in memory, open
+    files and generators are compressed chunk by chunk while they are sent.
+    """
+    if hasattr(data, 'read'):
+        # Check the encoding before the body starts streaming
+        _compressor(encoding)
+        return _compress_stream(data, encoding)
+    if hasattr(data, '__next__'):
+        _compressor(encoding)
+        return _compress_chunks(data, encoding)
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    compress, flush = _compressor(encoding)
+    return compress(data) + flush()
@@ -21,37 +21,130 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import base64
+import os
+import tempfile
 from shlex import quote
 from typing import Final
+from restcall.compression import COMMANDS
 
 BLACKLISTED_HEADERS: Final = ['Content-Length', 'User-Agent']
+# Ends the bodies embedded in the commands
+HEREDOC_DELIMITER: Final = 'RESTCALL_BODY'
+
+# Inline bodies larger than this many bytes are written to a temp file which
+# the curl command refers to. None keeps them inline.
+spill_size = None
 
 def is_header_allowed(header: tuple):
     return header[0] not in BLACKLISTED_HEADERS
 
 
-def to_curl(request, compressed=False, verify=True):
+def _is_generator(body) -> bool:
+    # Files are iterators too, but have a path
+    return hasattr(body, '__next__') and not hasattr(body, 'read')
+
+
+def _body_bytes(body) -> bytes:
+    return body.encode('utf-8') if isinstance(body, str) else body
+
+
+def _body_file(body, embed:bool=False):
+    """
+    Returns the path of the file holding the body, or None when the body is
+    kept inline. Binary and large bodies are written to a temp file, or with
+    `embed` are read from stdin, as `-`.
+    """
+    if hasattr(body, 'name'):
+        return body.name
+    body = _body_bytes(body)
+    try:
+        body.decode('utf-8')
+        if spill_size is None or len(body) <= spill_size:
+            return None
+    except UnicodeDecodeError:
+        pass
+    if embed:
+        return '-'
+    fd, filepath = tempfile.mkstemp(prefix='restcall-', suffix='.body')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(body)
+    return filepath
+
+
+def _compress_pipe(body, body_filepath, body_encoding):
+    command = COMMANDS[body_encoding]
+    # Streamed and embedded bodies, like stdin, are piped into the command
+    if _is_generator(body) or body_filepath == '-':
+        return '{0} | '.format(command)
+    if body_filepath:
+        return '{0} {1} | '.format(command, quote(body_filepath))
+    if isinstance(body, bytes):
+        body = body.decode('utf-8')
+    return 'printf %s {0} | {1} | '.format(quote(body), command)
+
+
+def to_curl(request, compressed=False, verify=True, body=None, body_encoding=None,
+        embed=False):
     """
     Returns string with curl command by provided request object
 
+    Bodies read from files are referred to by their path instead of being
+    copied into the command, streamed bodies are read from stdin.
+
     Parameters
     ----------
     compressed : bool
         If `True` then `--compressed` argument will be added to result
+    body : str, bytes, file, generator or MultipartStream
+        The request body as given to requests, before compression. Defaults
+        to the body of the request.
+    body_encoding : str
+        The encoding the request body is compressed with. The body is piped
+        into curl through the matching compressor.
+    embed : bool
+        If `True` then the bodies that would be written to a temp file are
+        embedded in the command as a base64 here-document instead, for
+        scripts that outlive the temp files.
     """
     parts = [
         ('curl', None),
         ('-X', request.method),
     ]
 
+    if body is None:
+        body = request.body
+    form_parts = getattr(body, 'parts', None)
+
     for k, v in sorted(filter(is_header_allowed, request.headers.items())):
+        # curl -F sets the multipart content type with its own boundary
+        if form_parts is not None and k.lower() == 'content-type':
+            continue
         parts += [('-H', '{0}: {1}'.format(k, v))]
 
-    if request.body:
-        body = request.body
-        if isinstance(body, bytes):
-            body = body.decode('utf-8')
-        parts += [('-d', body)]
+    body_filepath = None
+    if form_parts is None and body and not _is_generator(body):
+        body_filepath = _body_file(body, embed)
+
+    pipe = ''
+    if form_parts is not None:
+        for name, value, is_file in form_parts:
+            if is_file:
+                parts += [('-F', '{0}=@{1}'.format(name, value))]
+            else:
+                parts += [('--form-string', '{0}={1}'.format(name, value))]
+    elif body_encoding:
+        pipe = _compress_pipe(body, body_filepath, body_encoding)
+        parts += [('--data-binary', '@-')]
+    elif _is_generator(body):
+        parts += [('--data-binary', '@-')]
+    elif body:
+        if body_filepath:
+            parts += [('--data-binary', '@' + body_filepath)]
+        else:
+            if isinstance(body, bytes):
+                body = body.decode('utf-8')
+            parts += [('-d', body)]
 
     if compressed:
         parts += [('--compressed', None)]
@@ -71,5 +164,9 @@ def to_curl(request, compressed=False, verify=True):
         flat_parts.append(" \\\n")
     flat_parts.pop()
 
-    return ' '.join(flat_parts)
+    command = pipe + ' '.join(flat_parts)
+    if body_filepath == '-':
+        command = "base64 -d <<'{0}' | {1}\n{2}{0}".format(HEREDOC_DELIMITER, command,
+                base64.encodebytes(_body_bytes(body)).decode('ascii'))
+    return command
 
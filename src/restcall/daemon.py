@@ -0,0 +1,240 @@
+# MIT License
+# 
+# Copyright © 2022 Subhadip Ghosh
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the “Software”), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import collections
+import contextlib
+import io
+import json
+import os
+import socket
+import socketserver
+import signal
+import sys
+import threading
+from os import path
+from typing import Final
+
+# Only the standard library is imported at the top as the client side runs on
+# every call
+
+# The environment of the client that the calls made for it depend on
+FORWARDED_ENV: Final = ['HTTP_PROXY', 'HTTPS_PROXY', 'ALL_PROXY', 'NO_PROXY',
+        'http_proxy', 'https_proxy', 'all_proxy', 'no_proxy',
+        'REQUESTS_CA_BUNDLE', 'CURL_CA_BUNDLE', 'SSL_CERT_FILE', 'SSL_CERT_DIR',
+        'RESTCALL_CACHE_DIR', 'XDG_CACHE_HOME']
+
+# Held while the daemon runs a command
+_busy = threading.Lock()
+
+
+def socket_path() -> str:
+    """
+    Returns the path of the daemon socket. It can be overridden with
+    `RESTCALL_SOCKET`.
+    """
+    if os.environ.get('RESTCALL_SOCKET'):
+        return os.environ['RESTCALL_SOCKET']
+    if os.environ.get('XDG_RUNTIME_DIR'):
+        return path.join(os.environ['XDG_RUNTIME_DIR'], 'restcall.sock')
+    from restcall import diskcache
+    return path.join(diskcache.cache_dir('daemon'), 'restcall.sock')
+
+
+def forward(argv:list):
+    """
+    Runs the command in the daemon, if one is running and idle, and prints
+    its output as it is produced. Returns the exit status, or None when the
+    command has to run in this process.
+    """
+    if not hasattr(socket, 'AF_UNIX'):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path())
+    except OSError:
+        sock.close()
+        return None
+
+    out = sys.stdout
+    with sock, sock.makefile('rwb') as f:
+        request = {'argv': argv, 'cwd': os.getcwd(),
+                'env': {k: os.environ[k] for k in FORWARDED_ENV if k in os.environ}}
+        f.write(json.dumps(request).encode('utf-8') + b'\n')
+        f.flush()
+        for line in f:
+            message = json.loads(line)
+            if 'output' in message:
+                out.write(message['output'])
+                out.flush()
+            elif 'exit' in message:
+                return message['exit']
+            else:
+                # Busy with the command of another client, or the command
+                # reads stdin, which only this process can
+                return None
+    # The daemon went away without an exit status
+    return 1
+
+
+def _send(f, message:dict):
+    f.write(json.dumps(message).encode('utf-8') + b'\n')
+
+
+class _Stdin(io.TextIOBase):
+    """
+    Stands in for stdin while the daemon runs a command. The stdin of the
+    client is not forwarded, so a command reading it is run by the client.
+    """
+
+    def __init__(self):
+        self.needed = False
+
+    def _read(self, *args):
+        self.needed = True
+        raise OSError('stdin is only readable by the client')
+
+    read = readline = _read
+
+    @property
+    def buffer(self):
+        self._read()
+
+
+class _Output(io.TextIOBase):
+    """
+    Sends what the command prints to the client as it is written, unless
+    the command has to be run by the client.
+    """
+
+    def __init__(self, wfile, stdin:_Stdin):
+        self._wfile = wfile
+        self._stdin = stdin
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text:str) -> int:
+        if text and not self._stdin.needed:
+            try:
+                _send(self._wfile, {'output': text})
+            except OSError:
+                # The command runs to its end even if the client went away
+                pass
+        return len(text)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        request = json.loads(self.rfile.readline())
+        # Commands switch the working directory, the environment and the
+        # output of the whole process, so they run one at a time. While the
+        # daemon is busy, the clients run their commands themselves.
+        if not _busy.acquire(blocking=False):
+            _send(self.wfile, {'busy': True})
+            return
+        try:
+            command_stdin = _Stdin()
+            exit_code = self._run(request, command_stdin)
+        finally:
+            _busy.release()
+        if command_stdin.needed:
+            _send(self.wfile, {'needsStdin': True})
+        else:
+            _send(self.wfile, {'exit': exit_code})
+
+    def _run(self, request:dict, command_stdin:_Stdin) -> int:
+        from restcall.__main__ import _main
+
+        output = _Output(self.wfile, command_stdin)
+        cwd = os.getcwd()
+        stdin = sys.stdin
+        environ = {k: os.environ.get(k) for k in FORWARDED_ENV}
+        try:
+            os.chdir(request['cwd'])
+            _set_environ({k: request['env'].get(k) for k in FORWARDED_ENV})
+            sys.stdin = command_stdin
+            with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+                _main(request['argv'])
+            return 0
+        except SystemExit as e:
+            return e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+        except Exception as e:
+            output.write(f'\nERROR: Restcall daemon failed: {e!r}\n')
+            return 1
+        finally:
+            os.chdir(cwd)
+            _set_environ(environ)
+            sys.stdin = stdin
+
+
+def _set_environ(values:dict):
+    for name, value in values.items():
+        if value is None:
+            os.environ.pop(name, None)
+        elif os.environ.get(name) != value:
+            os.environ[name] = value
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    # The daemon must not be taken down by a misbehaving client
+    def handle_error(self, request, client_address):
+        pass
+
+
+def make_server(filepath:str=None) -> socketserver.UnixStreamServer:
+    """
+    Returns the daemon server. The calls it makes share one session and the
+    parsed templates, and the generated tokens stay in memory.
+    """
+    from restcall import restcall
+
+    filepath = filepath or socket_path()
+    if path.exists(filepath):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            try:
+                sock.connect(filepath)
+                raise RuntimeError(f'A restcall daemon is already listening on {filepath}')
+            except ConnectionRefusedError:
+                # Left behind by a daemon that did not shut down cleanly
+                os.remove(filepath)
+    server = _Server(filepath, _Handler)
+    os.chmod(filepath, 0o600)
+    restcall.shared_session = restcall.new_session()
+    restcall.template_cache = collections.OrderedDict()
+    return server
+
+
+def serve(filepath:str=None):
+    filepath = filepath or socket_path()
+    server = make_server(filepath)
+    print(f'Restcall daemon listening on {filepath}')
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        server.server_close()
+        if path.exists(filepath):
+            os.remove(filepath)
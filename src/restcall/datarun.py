@@ -0,0 +1,128 @@
+# MIT License
+# 
+# Copyright © 2022 Subhadip Ghosh
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the “Software”), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import contextlib
+import csv
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from restcall import restcall
+from restcall import placeholders
+from restcall import batch
+from restcall import sink
+from restcall.placeholders import RENDERED_FIELDS
+
+
+def read_rows(data_filepath:str):
+    """
+    Yields the rows of a CSV file with a header line, or of an NDJSON file
+    (`.ndjson` or `.jsonl`) with one JSON object per line.
+    """
+    with open(data_filepath, newline='') as f:
+        if data_filepath.endswith(('.ndjson', '.jsonl')):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(f)
+
+
+def compile_template(template:dict):
+    """
+    Compiles the placeholders of a template once. Returns a function that
+    renders the template for a row and its index.
+    """
+    # resFile is rendered too, so that rows do not overwrite each other's files
+    compiled = {field: placeholders.compile_value(template[field])
+            for field in RENDERED_FIELDS + ['resFile'] if field in template}
+
+    def render(row:dict, index:int) -> dict:
+        lookup = row.__getitem__
+        rendered = {**template, **{field: render_field(lookup) for field, render_field in compiled.items()}}
+        # Without a placeholder, every row would write the same file
+        if rendered.get('resFile') and rendered['resFile'] == template['resFile']:
+            root, ext = os.path.splitext(rendered['resFile'])
+            rendered['resFile'] = f'{root}-{index}{ext}'
+        return rendered
+    return render
+
+
+def _run_row(render, row:dict, index:int, filepath:str, session) -> dict:
+    return restcall.call_template(render(row, index), filepath, session=session, row=index)
+
+
+def run_data(filepath:str, data_filepath:str, workers:int=8) -> dict:
+    """
+    Calls the template once for every row of `data_filepath`, substituting
+    the `{{column}}` placeholders of the template with the values of the row.
+    The calls run on `workers` threads sharing one session. The results are
+    appended to `<name>-data.ndjson`, or to the sink, in the order they
+    complete, one record per row with its index and values. The bodies saved
+    to files are named after the index of the row.
+    """
+    render = compile_template(restcall.load_template(filepath))
+    data_res_filepath = sink.current.filepath if sink.current else filepath[:-5] + '-data.ndjson'
+    session = restcall.new_session(workers)
+    statuses = {}
+    failures = []
+    total = 0
+    running = {}
+
+    def write_done(done, out):
+        for future in done:
+            index, row = running.pop(future)
+            try:
+                res_data = future.result()
+            except Exception as e:
+                failures.append((f'{data_filepath}:{index}', e))
+                res_data = {'error': repr(e)}
+            else:
+                statuses[res_data['resStatus']] = statuses.get(res_data['resStatus'], 0) + 1
+            record = {'row': index, 'params': row, **res_data}
+            if sink.current:
+                sink.current.put({**sink.make_record(filepath, record), **record})
+            else:
+                out.write(json.dumps(record) + '\n')
+
+    start = time.perf_counter()
+    out = contextlib.nullcontext() if sink.current else open(data_res_filepath, 'w')
+    with out, ThreadPoolExecutor(max_workers=workers) as executor:
+        for index, row in enumerate(read_rows(data_filepath)):
+            # Only a few rows ahead of the workers are held in memory
+            if len(running) >= workers * 4:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                write_done(done, out)
+            running[executor.submit(_run_row, render, row, index, filepath, session)] = (index, row)
+            total += 1
+        write_done(list(running), out)
+    elapsed = time.perf_counter() - start
+    session.close()
+
+    summary = batch.summarize(total, statuses, failures, elapsed)
+    print('\nData run finished: {} rows in {:.3f}s ({:.2f} calls/s), succeeded: {}, failed: {}. Output stored in {}'.format(
+        summary['total'], summary['time'], summary['throughput'],
+        summary['succeeded'], summary['failed'], data_res_filepath))
+    if statuses:
+        print('Response statuses: ' + ', '.join(f'{s}: {c}' for s, c in sorted(statuses.items())))
+    for row, error in summary['failures']:
+        print(f'FAILED: {row}: {error}')
+    return summary
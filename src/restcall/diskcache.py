@@ -0,0 +1,84 @@
+# MIT License
+# 
+# Copyright © 2022 Subhadip Ghosh
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the “Software”), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+from os import path
+
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+
+
+def cache_dir(name:str) -> str:
+    """
+    Returns the directory for the named restcall cache, creating it if needed.
+    The base directory can be overridden with `RESTCALL_CACHE_DIR`.
+    """
+    base = os.environ.get('RESTCALL_CACHE_DIR') or path.join(
+            os.environ.get('XDG_CACHE_HOME') or path.expanduser('~/.cache'),
+            'restcall')
+    directory = path.join(base, name)
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    return directory
+
+
+@contextmanager
+def locked(lock_filepath:str):
+    """
+    Holds an exclusive lock on the file for the duration of the block. The lock
+    is shared between threads and processes. Locking is skipped where `fcntl`
+    is not available.
+    """
+    fd = os.open(lock_filepath, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        if fcntl:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        if fcntl:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+def read_json(filepath:str, default=None):
+    try:
+        with open(filepath) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {} if default is None else default
+
+
+def write_json(filepath:str, content):
+    """
+    Replaces the file atomically so that readers never see a partial write.
+    """
+    fd, tmp_filepath = tempfile.mkstemp(dir=path.dirname(filepath), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(content, f)
+        os.replace(tmp_filepath, filepath)
+    except BaseException:
+        os.remove(tmp_filepath)
+        raise
@@ -0,0 +1,131 @@
+# MIT License
+# 
+# Copyright © 2022 Subhadip Ghosh
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the “Software”), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import contextlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Final
+import requests
+from restcall import diskcache
+
+PART_SIZE: Final = 8 * 1024 * 1024
+CHUNK_SIZE: Final = 64 * 1024
+
+# Number of parallel connections for downloads to files, set with
+# --download-parts. None downloads over one stream.
+parts = None
+
+
+def get_parts(template:dict):
+    return template.get('resDownloadParts', parts)
+
+
+def _validator(res) -> str:
+    return res.headers.get('ETag') or res.headers.get('Last-Modified') or ''
+
+
+def supports_ranges(res) -> bool:
+    """
+    Whether the body of a response can be downloaded in parallel ranges: the
+    server accepts byte ranges, the size is known and the body is not
+    compressed.
+    """
+    return (res.request.method == 'GET'
+            and res.status_code == 200
+            and res.headers.get('Accept-Ranges', '').lower() == 'bytes'
+            and 'Content-Encoding' not in res.headers
+            and int(res.headers.get('Content-Length') or 0) > PART_SIZE)
+
+
+def _load_state(state_filepath:str, filepath:str, res, size:int) -> dict:
+    state = diskcache.read_json(state_filepath)
+    # A partial download is only resumed for the same version of the body
+    if (state.get('url') == res.url and state.get('size') == size
+            and state.get('validator') == _validator(res)
+            and os.path.exists(filepath) and os.path.getsize(filepath) == size):
+        return state
+    return {'url': res.url, 'size': size, 'validator': _validator(res), 'done': []}
+
+
+def _fetch_range(session, res, fd:int, start:int, end:int, timeout):
+    headers = {**res.request.headers, 'Range': f'bytes={start}-{end}',
+            'Accept-Encoding': 'identity'}
+    if _validator(res):
+        headers['If-Range'] = _validator(res)
+    with session.get(res.url, headers=headers, verify=False, stream=True,
+            timeout=timeout) as part:
+        if part.status_code != 206:
+            raise requests.HTTPError(f'Range request failed with status {part.status_code}, '
+                    'the body may have changed during the download', response=part)
+        offset = start
+        for chunk in part.iter_content(CHUNK_SIZE):
+            os.pwrite(fd, chunk, offset)
+            offset += len(chunk)
+    if offset != end + 1:
+        raise requests.ConnectionError(f'Range {start}-{end} ended early at {offset}')
+
+
+def download(res, filepath:str, parts:int, session:requests.Session, timeout=None) -> int:
+    """
+    Downloads the body of the response in `parts` parallel byte ranges into a
+    preallocated file, over a session with up to `parts` connections to the
+    host. Each range request is made with the given `timeout`. The finished ranges are recorded in a state file next
+    to it, so that an interrupted download only fetches the missing ranges
+    when it is run again. The file only replaces `filepath` once complete.
+    The response itself is closed without reading its body. Returns the size
+    of the body.
+    """
+    size = int(res.headers['Content-Length'])
+    part_filepath = filepath + '.part'
+    state_filepath = filepath + '.ranges.json'
+    state = _load_state(state_filepath, part_filepath, res, size)
+    done = {tuple(r) for r in state['done']}
+    ranges = [(start, min(start + PART_SIZE, size) - 1) for start in range(0, size, PART_SIZE)]
+    res.close()
+
+    fd = os.open(part_filepath, os.O_RDWR | os.O_CREAT, 0o644)
+    lock = threading.Lock()
+
+    def fetch(start, end):
+        _fetch_range(session, res, fd, start, end, timeout)
+        with lock:
+            state['done'].append([start, end])
+            diskcache.write_json(state_filepath, state)
+
+    try:
+        if not done:
+            os.ftruncate(fd, size)
+            # Reserves the blocks up front where the file system supports it
+            if hasattr(os, 'posix_fallocate'):
+                with contextlib.suppress(OSError):
+                    os.posix_fallocate(fd, 0, size)
+        with session, ThreadPoolExecutor(max_workers=parts) as executor:
+            futures = [executor.submit(fetch, start, end)
+                    for start, end in ranges if (start, end) not in done]
+            for future in futures:
+                future.result()
+    finally:
+        os.close(fd)
+    os.replace(part_filepath, filepath)
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(state_filepath)
+    return size
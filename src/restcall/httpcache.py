@@ -0,0 +1,212 @@
+# MIT License
+# 
+# Copyright © 2022 Subhadip Ghosh
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the “Software”), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import hashlib
+import json
+import os
+import tempfile
+import time
+from os import path
+from typing import Final
+import requests
+from requests.structures import CaseInsensitiveDict
+from restcall import diskcache
+
+DEFAULT_MAX_SIZE: Final = 256 * 1024 * 1024
+
+# None leaves it to the `resCache` field of the template, True caches all the
+# GET calls and False none
+enabled = None
+max_size = DEFAULT_MAX_SIZE
+
+
+def is_enabled(template:dict) -> bool:
+    if template['httpMethod'] != 'GET':
+        return False
+    return bool(template.get('resCache')) if enabled is None else enabled
+
+
+def cache_key(template:dict) -> str:
+    """
+    Returns the key of the call, which has to be computed before the auth
+    headers are added, so that a regenerated token keeps the same key.
+    """
+    request = [template['httpMethod'], template['url'], template['reqAuthType'],
+            template['reqAuthToken'], sorted(template['reqHeaders'].items())]
+    return hashlib.sha256(json.dumps(request).encode('utf-8')).hexdigest()
+
+
+def _paths(key:str) -> tuple:
+    directory = diskcache.cache_dir('http')
+    return (path.join(directory, key + '.json'), path.join(directory, key + '.body'))
+
+
+def validators(key:str) -> dict:
+    """
+    Returns the conditional request headers for the cached response, if any.
+    """
+    meta_filepath, body_filepath = _paths(key)
+    meta = diskcache.read_json(meta_filepath)
+    if not meta or not path.exists(body_filepath):
+        return {}
+    headers = {}
+    if 'ETag' in meta['headers']:
+        headers['If-None-Match'] = meta['headers']['ETag']
+    if 'Last-Modified' in meta['headers']:
+        headers['If-Modified-Since'] = meta['headers']['Last-Modified']
+    return headers
+
+
+class _TeeRaw:
+    """
+    Wraps the raw response so that the decoded body is copied to the cache
+    while it is streamed. The entry is only committed once the whole body has
+    been read.
+    """
+
+    def __init__(self, raw, key:str, res:requests.Response):
+        self._raw = raw
+        self._key = key
+        self._res = res
+
+    def stream(self, chunk_size, decode_content=True):
+        meta_filepath, body_filepath = _paths(self._key)
+        fd, tmp_filepath = tempfile.mkstemp(dir=path.dirname(body_filepath),
+                prefix=self._key, suffix='.tmp')
+        size = 0
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in self._raw.stream(chunk_size, decode_content=decode_content):
+                    f.write(chunk)
+                    size += len(chunk)
+                    yield chunk
+            _commit(self._key, self._res, tmp_filepath, size)
+        finally:
+            if path.exists(tmp_filepath):
+                os.remove(tmp_filepath)
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+
+def _commit(key:str, res:requests.Response, tmp_filepath:str, size:int):
+    meta_filepath, body_filepath = _paths(key)
+    headers = {k: v for k, v in res.headers.items()
+            if k.lower() not in ('content-encoding', 'content-length', 'transfer-encoding')}
+    meta = {
+            'url': res.url,
+            'status': res.status_code,
+            'reason': res.reason,
+            'headers': headers,
+            'size': size,
+            'lastUsed': time.time(),
+            }
+    directory = path.dirname(meta_filepath)
+    with diskcache.locked(path.join(directory, 'http.lock')):
+        os.replace(tmp_filepath, body_filepath)
+        diskcache.write_json(meta_filepath, meta)
+        _evict(directory)
+
+
+def _evict(directory:str):
+    # Least recently used entries go first
+    entries = []
+    for name in os.listdir(directory):
+        if name.endswith('.json'):
+            meta = diskcache.read_json(path.join(directory, name))
+            if meta:
+                entries.append((meta['lastUsed'], meta['size'], name[:-5]))
+    total = sum(size for _, size, _ in entries)
+    for _, size, key in sorted(entries):
+        if total <= max_size:
+            break
+        for filepath in _paths(key):
+            if path.exists(filepath):
+                os.remove(filepath)
+        total -= size
+
+
+class _CachedBody:
+    """
+    The body of a cached response, read from the cache file like from the
+    network. The file is closed once the body has been read to the end.
+    """
+
+    def __init__(self, filepath:str):
+        self._file = open(filepath, 'rb')
+
+    def read(self, size:int=-1) -> bytes:
+        if self._file.closed:
+            return b''
+        chunk = self._file.read(size)
+        if not chunk:
+            self._file.close()
+        return chunk
+
+    def close(self):
+        self._file.close()
+
+
+def _from_cache(key:str, res:requests.Response) -> requests.Response:
+    meta_filepath, body_filepath = _paths(key)
+    directory = path.dirname(meta_filepath)
+    with diskcache.locked(path.join(directory, 'http.lock')):
+        meta = diskcache.read_json(meta_filepath)
+        body = _CachedBody(body_filepath)
+        meta['lastUsed'] = time.time()
+        diskcache.write_json(meta_filepath, meta)
+
+    cached = requests.Response()
+    cached.status_code = meta['status']
+    cached.reason = meta['reason']
+    cached.headers = CaseInsensitiveDict(meta['headers'])
+    # Headers sent with the 304 supersede the cached ones
+    for k, v in res.headers.items():
+        if k.lower() not in ('content-length', 'content-encoding', 'transfer-encoding'):
+            cached.headers[k] = v
+    cached.headers['Content-Length'] = str(meta['size'])
+    cached.raw = body
+    cached.encoding = requests.utils.get_encoding_from_headers(cached.headers)
+    cached.url = res.url
+    cached.request = res.request
+    cached.elapsed = res.elapsed
+    cached.from_cache = True
+    if hasattr(res, 'timings'):
+        cached.timings = res.timings
+    res.close()
+    return cached
+
+
+def handle(key:str, res:requests.Response) -> requests.Response:
+    """
+    Returns the cached response if the server answered 304 Not Modified.
+    Otherwise arranges for a cacheable response to be stored while it is read.
+    """
+    meta_filepath, body_filepath = _paths(key)
+    if res.status_code == 304 and path.exists(meta_filepath) and path.exists(body_filepath):
+        return _from_cache(key, res)
+
+    cacheable = (res.status_code == 200
+            and ('ETag' in res.headers or 'Last-Modified' in res.headers)
+            and 'no-store' not in res.headers.get('Cache-Control', ''))
+    if cacheable:
+        res.raw = _TeeRaw(res.raw, key, res)
+    return res
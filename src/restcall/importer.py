@@ -0,0 +1,247 @@
+# MIT License
+# 
+# Copyright © 2022 Subhadip Ghosh
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the “Software”), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import collections
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from os import path
+from typing import Final
+from urllib.parse import urlsplit
+from restcall import restcall
+
+READ_SIZE: Final = 1024 * 1024
+ENTRIES: Final = re.compile(r'"entries"\s*:\s*\[')
+# Characters that open or close a JSON object, array or string
+STRUCTURE: Final = re.compile(r'[][{}"]')
+# Characters that end a string or escape the next one
+STRING_END: Final = re.compile(r'["\\]')
+# Headers set by the browser or by requests for every call
+SKIPPED_HEADERS: Final = {'content-length', 'host', 'connection', 'accept-encoding'}
+
+
+class _ValueEnd:
+    """
+    Finds the end of a JSON object or array fed to it in parts. Its state is
+    kept between the parts so that every part is scanned once.
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, text:str) -> bool:
+        """
+        Scans the next part of the value. Returns whether the value ends in it.
+        """
+        # The character escaped by a backslash at the end of the last part
+        pos = 1 if self.escaped else 0
+        self.escaped = False
+        while True:
+            if self.in_string:
+                match = STRING_END.search(text, pos)
+                if not match:
+                    return False
+                if match.group() == '\\':
+                    if match.end() == len(text):
+                        self.escaped = True
+                        return False
+                    pos = match.end() + 1
+                    continue
+                self.in_string = False
+            else:
+                match = STRUCTURE.search(text, pos)
+                if not match:
+                    return False
+                char = match.group()
+                if char == '"':
+                    self.in_string = True
+                elif char in '{[':
+                    self.depth += 1
+                else:
+                    self.depth -= 1
+                    if self.depth == 0:
+                        return True
+            pos = match.end()
+
+
+def iter_har_entries(filepath:str):
+    """
+    Yields the entries of a HAR file one by one, reading the file in chunks
+    so that large exports are never loaded fully in memory.
+    """
+    decoder = json.JSONDecoder()
+    with open(filepath, encoding='utf-8') as f:
+        buffer = ''
+        while True:
+            chunk = f.read(READ_SIZE)
+            if not chunk:
+                return
+            buffer += chunk
+            match = ENTRIES.search(buffer)
+            if match:
+                buffer = buffer[match.end():]
+                break
+            # Keep enough of the tail for a key split between two chunks
+            buffer = buffer[-64:]
+
+        pos = 0
+        eof = False
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                pos += 1
+            if pos < len(buffer) and buffer[pos] == ']':
+                return
+            try:
+                entry, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                # The entry continues in the next chunks. They are read up to
+                # its end before it is decoded again, instead of decoding it
+                # from its start after every chunk.
+                parts = [buffer[pos:]]
+                scanner = _ValueEnd()
+                ended = scanner.feed(parts[0])
+                while not ended:
+                    chunk = f.read(READ_SIZE)
+                    if not chunk:
+                        eof = True
+                        break
+                    parts.append(chunk)
+                    ended = scanner.feed(chunk)
+                buffer = ''.join(parts)
+                pos = 0
+                continue
+            yield entry
+            # Drop what has been decoded once it grows large
+            if pos > READ_SIZE:
+                buffer = buffer[pos:]
+                pos = 0
+
+
+def iter_curl_commands(filepath:str):
+    """
+    Yields the curl commands of a file, one per command even when they span
+    several lines.
+    """
+    command = []
+    with open(filepath) as f:
+        for line in f:
+            if line.lstrip().startswith('curl ') and command:
+                yield ''.join(command)
+                command = []
+            if line.strip() or command:
+                command.append(line.rstrip('\n').removesuffix('\\') + ' ')
+    if command:
+        yield ''.join(command)
+
+
+def har_to_template(entry:dict) -> dict:
+    request = entry['request']
+    headers = {h['name']: h['value'] for h in request.get('headers', [])
+            # HTTP/2 pseudo headers like :authority
+            if not h['name'].startswith(':') and h['name'].lower() not in SKIPPED_HEADERS}
+    auth_type, auth_token = restcall._extract_authorization(headers)
+    content_type = next((v for k, v in headers.items() if k.lower() == 'content-type'), '')
+    post_data = request.get('postData') or {}
+    return {
+            'url': request['url'],
+            'httpMethod': request['method'].upper(),
+            'reqAuthType': auth_type,
+            'reqAuthToken': auth_token,
+            'reqContentType': content_type or post_data.get('mimeType', ''),
+            'reqHeaders': {k: v for k, v in headers.items() if k.lower() != 'content-type'},
+            'reqPayload': restcall._parse_data(post_data.get('text')),
+            'resFile': '',
+            }
+
+
+def template_name(template:dict) -> str:
+    """
+    Returns the file name for a template, made of its method and URL path,
+    like `get-api-users-42.json`.
+    """
+    slug = re.sub(r'[^A-Za-z0-9]+', '-', urlsplit(template['url']).path).strip('-')
+    return '{}-{}.json'.format(template['httpMethod'].lower(), slug[:100] or 'root')
+
+
+def _convert(item:tuple):
+    kind, value = item
+    try:
+        return har_to_template(value) if kind == 'har' else restcall.curl_to_template(value)
+    except Exception as e:
+        return e
+
+
+def _is_har(filepath:str) -> bool:
+    if filepath.endswith('.har'):
+        return True
+    with open(filepath) as f:
+        return f.read(64).lstrip().startswith('{')
+
+
+def import_file(filepath:str, output_dir:str, workers:int=None) -> dict:
+    """
+    Converts the entries of a HAR file, or the commands of a file with curl
+    commands, to templates in `output_dir`. The input is read incrementally
+    and converted on `workers` processes. Templates whose name is already
+    taken are skipped.
+    """
+    if _is_har(filepath):
+        # The responses are not converted, so they are not sent to the workers
+        items = (('har', {k: v for k, v in entry.items() if k != 'response'})
+                for entry in iter_har_entries(filepath))
+    else:
+        items = (('curl', command) for command in iter_curl_commands(filepath))
+    workers = workers or os.cpu_count() or 1
+    os.makedirs(output_dir, exist_ok=True)
+    written = []
+    skipped = 0
+    failed = 0
+
+    def write(template):
+        nonlocal skipped, failed
+        if isinstance(template, Exception):
+            print(f'WARN: Could not convert an entry: {template!r}')
+            failed += 1
+            return
+        template_filepath = path.join(output_dir, template_name(template))
+        if path.exists(template_filepath):
+            skipped += 1
+            return
+        restcall._write_template(template_filepath, template)
+        written.append(template_filepath)
+
+    # Converted in input order, with a bounded number of entries in flight
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        running = collections.deque()
+        for item in items:
+            if len(running) >= workers * 4:
+                write(running.popleft().result())
+            running.append(executor.submit(_convert, item))
+        while running:
+            write(running.popleft().result())
+
+    print(f'Imported {len(written)} templates to {output_dir}, skipped {skipped} duplicates, failed: {failed}')
+    return {'written': written, 'skipped': skipped, 'failed': failed}
@@ -0,0 +1,107 @@
+# MIT License
+# 
+# Copyright © 2022 Subhadip Ghosh
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the “Software”), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import threading
+import time
+from typing import Final
+from urllib.parse import urlsplit
+
+# Responses asking the client to back off
+BACKOFF_STATUSES: Final = [429, 503]
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit adapted AIMD style: it grows by one every time a full
+    window of calls completes with a flat latency, and is halved on 429 and
+    503 responses, errors, or when the smoothed latency of a host rises above
+    `latency_tolerance` times the best latency seen for that host. It is cut
+    at most once per smoothed latency, so that one burst of slow calls counts
+    once.
+    """
+
+    def __init__(self, maximum:int, minimum:int=1, initial:int=1,
+            latency_tolerance:float=2.0):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.limit = float(max(minimum, min(initial, maximum)))
+        self.peak = int(self.limit)
+        self.latency_tolerance = latency_tolerance
+        self._in_flight = 0
+        # The [smoothed, best] latency per host, as hosts differ in latency
+        self._latencies = {}
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            while self._in_flight >= int(self.limit):
+                self._condition.wait()
+            self._in_flight += 1
+
+    def release(self, latency:float, status:int=None, url:str=''):
+        """
+        Records a completed call to `url`. `status` is None when the call
+        failed.
+        """
+        host = urlsplit(url).netloc
+        with self._condition:
+            self._in_flight -= 1
+            smoothed, best = self._latencies.get(host, (latency, latency))
+            smoothed = 0.8 * smoothed + 0.2 * latency
+            best = min(best, latency)
+            self._latencies[host] = (smoothed, best)
+
+            overloaded = (status is None or status in BACKOFF_STATUSES
+                    or smoothed > best * self.latency_tolerance)
+            now = time.monotonic()
+            if overloaded:
+                if now - self._last_decrease > smoothed:
+                    self.limit = max(self.minimum, self.limit / 2)
+                    self._last_decrease = now
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self.peak = max(self.peak, int(self.limit))
+            self._condition.notify_all()
+
+
+class RateLimiter:
+    """
+    Token bucket per host allowing `rate` requests per second, with bursts of
+    up to `rate` requests.
+    """
+
+    def __init__(self, rate:float):
+        self.rate = rate
+        self.capacity = max(1.0, rate)
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url:str):
+        host = urlsplit(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            tokens, last = self._buckets.get(host, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - last) * self.rate) - 1
+            self._buckets[host] = (tokens, now)
+        # A negative balance is the time this call has to wait for its token
+        if tokens < 0:
+            time.sleep(-tokens / self.rate)
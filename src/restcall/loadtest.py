@@ -0,0 +1,129 @@
+# MIT License
+# 
+# Copyright © 2022 Subhadip Ghosh
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the “Software”), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import threading
+import time
+from typing import Final
+from restcall import restcall
+from restcall.retry import copy_template
+from restcall.stats import LatencyHistogram
+
+DEFAULT_REQUESTS: Final = 100
+
+
+class _LoadRun:
+
+    def __init__(self, template:dict, filepath:str, requests:int, duration:float,
+            session):
+        self.template = template
+        self.filepath = filepath
+        self.remaining = requests
+        self.deadline = time.perf_counter() + duration if duration else None
+        self.session = session
+        self.histogram = LatencyHistogram()
+        self.statuses = {}
+        self.errors = {}
+        self.lock = threading.Lock()
+
+    def _next(self) -> bool:
+        with self.lock:
+            if self.deadline and time.perf_counter() >= self.deadline:
+                return False
+            if self.remaining is None:
+                return True
+            if self.remaining <= 0:
+                return False
+            self.remaining -= 1
+            return True
+
+    def worker(self):
+        histogram = LatencyHistogram()
+        while self._next():
+            start = time.perf_counter()
+            try:
+                res = restcall._do_call(copy_template(self.template),
+                        self.filepath, self.session)
+                try:
+                    for _ in res.iter_content(restcall.CHUNK_SIZE):
+                        pass
+                finally:
+                    res.close()
+            except Exception as e:
+                with self.lock:
+                    name = type(e).__name__
+                    self.errors[name] = self.errors.get(name, 0) + 1
+                continue
+            histogram.record(time.perf_counter() - start)
+            with self.lock:
+                status = str(res.status_code)
+                self.statuses[status] = self.statuses.get(status, 0) + 1
+        with self.lock:
+            self.histogram.merge(histogram)
+
+
+def run_load(filepath:str, requests:int=None, concurrency:int=1,
+        duration:float=None) -> dict:
+    """
+    Replays the template `requests` times, or for `duration` seconds, from
+    `concurrency` threads sharing one connection pool. The report is written
+    to `<name>-load.json` and returned.
+    """
+    if requests is None and duration is None:
+        requests = DEFAULT_REQUESTS
+    template = restcall.load_template(filepath)
+    session = restcall.new_session(concurrency)
+    run = _LoadRun(template, filepath, requests, duration, session)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=run.worker) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    session.close()
+
+    completed = run.histogram.count + sum(run.errors.values())
+    report = {
+            'url': template['url'],
+            'httpMethod': template['httpMethod'],
+            'concurrency': concurrency,
+            'requests': completed,
+            'time': elapsed,
+            'throughput': completed / elapsed if elapsed else 0.0,
+            'statuses': run.statuses,
+            'errors': run.errors,
+            'latency': run.histogram.summary(),
+            }
+    report_filepath = filepath[:-5] + '-load.json'
+    restcall._write_template(report_filepath, report)
+    _print_report(report, report_filepath)
+    return report
+
+
+def _print_report(report:dict, report_filepath:str):
+    latency = report['latency']
+    print('Load test: {} requests in {:.3f}s ({:.2f} req/s), concurrency: {}'.format(
+        report['requests'], report['time'], report['throughput'], report['concurrency']))
+    print('Latency p50: {:.4f}s, p90: {:.4f}s, p99: {:.4f}s, max: {:.4f}s'.format(
+        latency['p50'], latency['p90'], latency['p99'], latency['max']))
+    print('Statuses: {}, errors: {}. Report stored in {}'.format(
+        report['statuses'], report['errors'], report_filepath))
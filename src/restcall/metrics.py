@@ -0,0 +1,198 @@
+# MIT License
+# 
+# Copyright © 2022 Subhadip Ghosh
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the “Software”), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import bisect
+import os
+import socket
+import tempfile
+import threading
+from os import path
+from typing import Final
+from urllib.parse import urlsplit
+
+# Upper bounds of the latency histogram buckets, in seconds
+BUCKETS: Final = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Keeps the StatsD datagrams below the usual network MTU
+MAX_DATAGRAM_SIZE: Final = 1400
+
+# Path of the OpenMetrics textfile written after every run, set with --metrics-file
+textfile_path = None
+# StatsdClient the observations are sent to, set with --statsd
+statsd = None
+# Functions called with every observation, registered with add_callback()
+callbacks = []
+
+_lock = threading.Lock()
+# Histogram per label set: bucket counts, sum and count
+_series = {}
+
+
+def enabled() -> bool:
+    return bool(textfile_path or statsd or callbacks)
+
+
+def add_callback(callback):
+    """
+    Registers a function that is called with every observation, a dict with
+    the labels, the status and the latency in seconds.
+    """
+    callbacks.append(callback)
+
+
+def status_class(status) -> str:
+    return 'error' if status is None else f'{status // 100}xx'
+
+
+def observe(filepath:str, template:dict, status, latency:float):
+    """
+    Records a call of the template that ended with the status, or None on an
+    error, after `latency` seconds.
+    """
+    if not enabled():
+        return
+    labels = (filepath, template['httpMethod'], urlsplit(template['url']).hostname or '',
+            status_class(status))
+    index = bisect.bisect_left(BUCKETS, latency)
+    with _lock:
+        series = _series.get(labels)
+        if series is None:
+            series = _series[labels] = [[0] * (len(BUCKETS) + 1), 0.0, 0]
+        series[0][index] += 1
+        series[1] += latency
+        series[2] += 1
+    if statsd:
+        statsd.observe(labels, latency)
+    if callbacks:
+        observation = {'template': labels[0], 'method': labels[1], 'host': labels[2],
+                'statusClass': labels[3], 'status': status, 'latency': latency}
+        for callback in callbacks:
+            callback(observation)
+
+
+def _label_value(value:str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def openmetrics() -> str:
+    """
+    Returns the metrics collected so far in the OpenMetrics text format.
+    """
+    with _lock:
+        series = {labels: (list(buckets), total, count) for labels, (buckets, total, count) in _series.items()}
+
+    requests_lines = []
+    duration_lines = []
+    for labels, (buckets, total, count) in sorted(series.items()):
+        label_text = 'template="{}",method="{}",host="{}",status_class="{}"'.format(
+                *map(_label_value, labels))
+        requests_lines.append(f'restcall_requests_total{{{label_text}}} {count}')
+        cumulative = 0
+        for bound, bucket in zip(BUCKETS + ('+Inf',), buckets):
+            cumulative += bucket
+            duration_lines.append(f'restcall_request_duration_seconds_bucket{{{label_text},le="{bound}"}} {cumulative}')
+        duration_lines.append(f'restcall_request_duration_seconds_sum{{{label_text}}} {total}')
+        duration_lines.append(f'restcall_request_duration_seconds_count{{{label_text}}} {count}')
+
+    return '\n'.join([
+        '# TYPE restcall_requests counter',
+        '# HELP restcall_requests Calls made, by template, method, host and status class.',
+        *requests_lines,
+        '# TYPE restcall_request_duration_seconds histogram',
+        '# HELP restcall_request_duration_seconds Latency of the calls, including the body download.',
+        '# UNIT restcall_request_duration_seconds seconds',
+        *duration_lines,
+        '# EOF',
+        ]) + '\n'
+
+
+def write_textfile(filepath:str):
+    """
+    Replaces the textfile atomically, as the node exporter textfile collector
+    expects.
+    """
+    fd, tmp_filepath = tempfile.mkstemp(dir=path.dirname(path.abspath(filepath)), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(openmetrics())
+        os.replace(tmp_filepath, filepath)
+    except BaseException:
+        os.remove(tmp_filepath)
+        raise
+
+
+def flush():
+    """
+    Writes the textfile and sends the buffered StatsD metrics.
+    """
+    if textfile_path:
+        write_textfile(textfile_path)
+    if statsd:
+        statsd.flush()
+
+
+def reset():
+    with _lock:
+        _series.clear()
+
+
+class StatsdClient:
+    """
+    Sends the observations to StatsD over UDP, as a counter and a timer with
+    DogStatsD tags. Several metrics are packed into each datagram.
+    """
+
+    def __init__(self, address:str, prefix:str='restcall'):
+        host, _, port = address.rpartition(':')
+        self.address = (host or 'localhost', int(port))
+        self.prefix = prefix
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._lock = threading.Lock()
+        self._buffer = []
+        self._size = 0
+
+    def observe(self, labels:tuple, latency:float):
+        tags = '|#template:{},method:{},host:{},status_class:{}'.format(
+                *(v.replace(',', '_').replace('|', '_') for v in labels))
+        lines = [f'{self.prefix}.requests:1|c{tags}',
+                f'{self.prefix}.request_duration:{latency * 1000:.3f}|ms{tags}']
+        size = sum(len(line) + 1 for line in lines)
+        with self._lock:
+            if self._size + size > MAX_DATAGRAM_SIZE:
+                self._send()
+            self._buffer += lines
+            self._size += size
+
+    def flush(self):
+        with self._lock:
+            self._send()
+
+    def _send(self):
+        if self._buffer:
+            try:
+                self._socket.sendto('\n'.join(self._buffer).encode('utf-8'), self.address)
+            except OSError as e:
+                print(f'WARN: Could not send metrics to StatsD: {e}')
+            self._buffer = []
+            self._size = 0
+
+    def close(self):
+        self.flush()
+        self._socket.close()
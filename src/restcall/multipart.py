@@ -0,0 +1,136 @@
+# MIT License
+# 
+# Copyright © 2022 Subhadip Ghosh
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the “Software”), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import io
+import json
+import mimetypes
+import os
+import uuid
+from os import path
+
+
+def _quote(value:str) -> str:
+    # As browsers do for form field and file names
+    return value.replace('\r', '%0D').replace('\n', '%0A').replace('"', '%22')
+
+
+class MultipartStream(io.RawIOBase):
+    """
+    A multipart/form-data body that is encoded while it is read, so files are
+    sent chunk by chunk and never held in memory. The length is known up
+    front, so the body is sent with a `Content-Length`.
+
+    `fields` is a list of (name, value) pairs. Values starting with `@` are
+    paths of files to upload, like with `curl -F`.
+    """
+
+    def __init__(self, fields:list):
+        super().__init__()
+        boundary = uuid.uuid4().hex
+        self.content_type = 'multipart/form-data; boundary=' + boundary
+        # The (name, value, is_file) of every field, for the curl command
+        self.parts = []
+        # Bytes, or paths of the files to read
+        self._segments = []
+        for name, value in fields:
+            if isinstance(value, str) and value.startswith('@'):
+                filepath = value[1:]
+                content_type = mimetypes.guess_type(filepath)[0] or 'application/octet-stream'
+                self._segments += [(f'--{boundary}\r\nContent-Disposition: form-data; '
+                        f'name="{_quote(name)}"; filename="{_quote(path.basename(filepath))}"\r\n'
+                        f'Content-Type: {content_type}\r\n\r\n').encode('utf-8'),
+                        filepath, b'\r\n']
+                self.parts.append((name, filepath, True))
+            else:
+                value = value if isinstance(value, str) else json.dumps(value)
+                self._segments += [(f'--{boundary}\r\nContent-Disposition: form-data; '
+                        f'name="{_quote(name)}"\r\n\r\n').encode('utf-8'),
+                        value.encode('utf-8'), b'\r\n']
+                self.parts.append((name, value, False))
+        self._segments.append(f'--{boundary}--\r\n'.encode('utf-8'))
+        # Missing files fail here, before the request is sent
+        self._length = sum(len(s) if isinstance(s, bytes) else os.path.getsize(s)
+                for s in self._segments)
+        self._position = 0
+        self._index = 0
+        self._offset = 0
+        self._file = None
+
+    def __len__(self) -> int:
+        return self._length
+
+    def readable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def readinto(self, buffer) -> int:
+        if not len(buffer):
+            return 0
+        while self._index < len(self._segments):
+            segment = self._segments[self._index]
+            if isinstance(segment, bytes):
+                n = min(len(buffer), len(segment) - self._offset)
+                buffer[:n] = segment[self._offset:self._offset + n]
+                self._offset += n
+                if self._offset == len(segment):
+                    self._next_segment()
+                if not n:
+                    continue
+            else:
+                if self._file is None:
+                    self._file = open(segment, 'rb')
+                n = self._file.readinto(buffer)
+                if not n:
+                    self._next_segment()
+                    continue
+            self._position += n
+            return n
+        return 0
+
+    def _next_segment(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+        self._index += 1
+        self._offset = 0
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+        super().close()
+
+
+def form_fields(payload) -> list:
+    """
+    Returns the (name, value) pairs of a multipart `reqPayload`: the path of
+    a single file, sent as the `file` field, or an object of fields where a
+    list value sends the field once per item.
+    """
+    if isinstance(payload, str):
+        return [('file', '@' + payload)]
+    fields = []
+    for name, value in payload.items():
+        for item in value if isinstance(value, list) else [value]:
+            fields.append((name, item))
+    return fields
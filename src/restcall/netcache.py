@@ -0,0 +1,152 @@
+# MIT License
+# 
+# Copyright © 2022 Subhadip Ghosh
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the “Software”), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import ipaddress
+import socket
+import ssl
+import threading
+import time
+from os import path
+from restcall import diskcache
+
+# Seconds the resolved addresses of a host are reused for, also by later
+# restcall processes, set with --dns-cache. None resolves every connection.
+dns_ttl = None
+# Whether TLS sessions are resumed on new connections, set with --tls-resume
+tls_resume = False
+
+stats = {'dnsHits': 0, 'dnsMisses': 0, 'tlsResumed': 0, 'tlsFull': 0}
+
+_dns_lock = threading.Lock()
+# Loaded from disk on first use
+_dns = None
+_tls_context = None
+_tls_lock = threading.Lock()
+# Latest session per server, keyed by host name and port
+_sessions = {}
+
+
+def _is_ip(host:str) -> bool:
+    try:
+        ipaddress.ip_address(host)
+        return True
+    except ValueError:
+        return False
+
+
+def _dns_filepath() -> str:
+    return path.join(diskcache.cache_dir('dns'), 'dns.json')
+
+
+def _from_json(addresses:list) -> list:
+    return [(socket.AddressFamily(family), socket.SocketKind(kind), proto, canonname, tuple(sockaddr))
+            for family, kind, proto, canonname, sockaddr in addresses]
+
+
+def resolve(host:str, port:int, family:int) -> list:
+    """
+    Resolves the host like `socket.getaddrinfo`. With `dns_ttl` the addresses
+    are cached in memory and on disk until they are older than the TTL.
+    """
+    if not dns_ttl or _is_ip(host):
+        return socket.getaddrinfo(host, port, family, socket.SOCK_STREAM)
+
+    global _dns
+    key = f'{host}:{port}:{int(family)}'
+    now = time.time()
+    with _dns_lock:
+        if _dns is None:
+            _dns = diskcache.read_json(_dns_filepath())
+        entry = _dns.get(key)
+        if entry and entry['expires'] > now:
+            stats['dnsHits'] += 1
+            return _from_json(entry['addresses'])
+        stats['dnsMisses'] += 1
+
+    addresses = socket.getaddrinfo(host, port, family, socket.SOCK_STREAM)
+    entry = {'expires': now + dns_ttl,
+            'addresses': [[int(f), int(k), p, c, list(s)] for f, k, p, c, s in addresses]}
+    with _dns_lock:
+        _dns[key] = entry
+        with diskcache.locked(path.join(diskcache.cache_dir('dns'), 'dns.lock')):
+            # Other processes may have resolved other hosts in the meantime
+            cached = diskcache.read_json(_dns_filepath())
+            cached = {k: v for k, v in cached.items() if v['expires'] > now}
+            cached[key] = entry
+            diskcache.write_json(_dns_filepath(), cached)
+    return addresses
+
+
+def _session_key(sock, server_hostname) -> tuple:
+    # Connections to IP addresses are made without a server name
+    peer = sock.getpeername()
+    return (server_hostname or peer[0], peer[1])
+
+
+class _ResumingContext(ssl.SSLContext):
+
+    def wrap_socket(self, sock, *args, **kwargs):
+        if kwargs.get('session') is None:
+            kwargs['session'] = _sessions.get(_session_key(sock, kwargs.get('server_hostname')))
+        return super().wrap_socket(sock, *args, **kwargs)
+
+
+def tls_context() -> ssl.SSLContext:
+    """
+    Returns the TLS context shared by the connections, as sessions can only
+    be resumed with the context that created them. Unlike the default
+    context of urllib3, it accepts session tickets.
+    """
+    global _tls_context
+    with _tls_lock:
+        if _tls_context is None:
+            context = _ResumingContext(ssl.PROTOCOL_TLS_CLIENT)
+            # urllib3 matches the host name itself when verifying
+            context.check_hostname = False
+            context.options |= ssl.OP_NO_COMPRESSION
+            context.load_default_certs()
+            _tls_context = context
+        return _tls_context
+
+
+def record_handshake(sock):
+    if isinstance(sock, ssl.SSLSocket):
+        stats['tlsResumed' if sock.session_reused else 'tlsFull'] += 1
+
+
+def save_session(sock):
+    """
+    Keeps the TLS session of the connection for the next connections to the
+    same server. With TLS 1.3 the session tickets arrive after the handshake,
+    so this is called once the response headers have been read.
+    """
+    if isinstance(sock, ssl.SSLSocket) and sock.session is not None:
+        _sessions[_session_key(sock, sock.server_hostname)] = sock.session
+
+
+def reset_stats():
+    for key in stats:
+        stats[key] = 0
+
+
+def report() -> str:
+    return 'DNS cache: {} hits, {} misses. TLS handshakes: {} resumed, {} full'.format(
+            stats['dnsHits'], stats['dnsMisses'], stats['tlsResumed'], stats['tlsFull'])
@@ -0,0 +1,132 @@
+# MIT License
+# 
+# Copyright © 2022 Subhadip Ghosh
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the “Software”), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode, urljoin
+from restcall.retry import copy_template
+
+
+def _field(body, field_path:str):
+    value = body
+    for field in field_path.split('.'):
+        if value is None:
+            return None
+        value = value[int(field)] if isinstance(value, list) else value.get(field)
+    return value
+
+
+def _with_param(url:str, name:str, value) -> str:
+    parts = urlsplit(url)
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k != name]
+    query.append((name, str(value)))
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def _next_url(options:dict, res, body):
+    """
+    Returns the URL of the next page, from the `Link: rel=next` header or
+    from the cursor field of the body, or None on the last page.
+    """
+    if options.get('next', 'link') == 'link':
+        next_link = res.links.get('next')
+        return urljoin(res.url, next_link['url']) if next_link else None
+    cursor = _field(body, options['cursorField'])
+    if cursor in (None, ''):
+        return None
+    # Some APIs return the URL of the next page instead of a cursor
+    if isinstance(cursor, str) and cursor.startswith(('http://', 'https://')):
+        return cursor
+    return _with_param(res.url, options.get('cursorParam', 'cursor'), cursor)
+
+
+def _close(future):
+    future.add_done_callback(lambda f: f.exception() is None and f.result().close())
+
+
+def paginate(template:dict, filepath:str, fetch) -> dict:
+    """
+    Follows the pages of a paginated API as configured in `resPaginate`.
+    `fetch(template)` makes a call and returns the streamed response. The
+    items of every page are appended to `<name>-res.ndjson` as they arrive,
+    while the next page is already being fetched. Returns the response data
+    for the response file.
+    """
+    options = template['resPaginate']
+    max_pages = options.get('maxPages')
+    max_items = options.get('maxItems')
+    ndjson_filepath = filepath[:-5] + '-res.ndjson'
+    pages = 0
+    items = 0
+    size = 0
+    start = time.perf_counter()
+
+    def fetch_page(url:str):
+        return fetch({**copy_template(template), 'url': url})
+
+    with open(ndjson_filepath, 'w') as out, ThreadPoolExecutor(max_workers=1) as prefetcher:
+        future = prefetcher.submit(fetch, template)
+        while future:
+            res = future.result()
+            future = None
+            # With Link headers the next page is known before the body is read
+            next_url = _next_url(options, res, None) if options.get('next', 'link') == 'link' else None
+            if next_url and (not max_pages or pages + 1 < max_pages):
+                future = prefetcher.submit(fetch_page, next_url)
+
+            try:
+                if res.status_code >= 400:
+                    break
+                content = res.content
+                body = json.loads(content)
+            finally:
+                res.close()
+            pages += 1
+            size += len(content)
+
+            if options.get('next', 'link') != 'link':
+                next_url = _next_url(options, res, body)
+                if next_url and (not max_pages or pages < max_pages):
+                    future = prefetcher.submit(fetch_page, next_url)
+
+            page_items = _field(body, options['itemsField']) if options.get('itemsField') else [body]
+            for item in page_items or []:
+                if max_items and items >= max_items:
+                    break
+                out.write(json.dumps(item) + '\n')
+                items += 1
+            if max_items and items >= max_items and future:
+                _close(future)
+                future = None
+
+        if future:
+            _close(future)
+
+    return {
+            'resStatus': res.status_code,
+            'resHeaders': dict(res.headers),
+            'resSize': f'{size/1024:.3f}K',
+            'resTime': f'{time.perf_counter() - start}s',
+            'resPages': pages,
+            'resItems': items,
+            'resBody': 'Response has been saved to ' + ndjson_filepath,
+            }
@@ -0,0 +1,77 @@
+# MIT License
+# 
+# Copyright © 2022 Subhadip Ghosh
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the “Software”), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import json
+import re
+from typing import Final
+
+PLACEHOLDER: Final = re.compile(r'\{\{\s*([^{}]+?)\s*\}\}')
+# Template fields in which placeholders are substituted
+RENDERED_FIELDS: Final = ['url', 'reqAuthToken', 'reqHeaders', 'reqPayload']
+
+
+def _compile_str(value:str):
+    parts = PLACEHOLDER.split(value)
+    if len(parts) == 1:
+        return lambda lookup: value
+    # A string that is a single placeholder takes the type of its value
+    if len(parts) == 3 and parts[0] == '' and parts[2] == '':
+        name = parts[1]
+        return lambda lookup: lookup(name)
+
+    def render(lookup):
+        # Placeholder names are at the odd positions of the split
+        return ''.join(_to_str(lookup(p)) if i % 2 else p for i, p in enumerate(parts))
+    return render
+
+
+def _to_str(value) -> str:
+    return value if isinstance(value, str) else json.dumps(value)
+
+
+def compile_value(value):
+    """
+    Compiles a template value with `{{name}}` placeholders into a function
+    that renders it for a lookup function, which returns the value of a name.
+    Dicts and lists are compiled recursively, so rendering only substitutes.
+    """
+    if isinstance(value, str):
+        return _compile_str(value)
+    if isinstance(value, dict):
+        compiled = [(_compile_str(k), compile_value(v)) for k, v in value.items()]
+        return lambda lookup: {k(lookup): v(lookup) for k, v in compiled}
+    if isinstance(value, list):
+        compiled = [compile_value(v) for v in value]
+        return lambda lookup: [v(lookup) for v in compiled]
+    return lambda lookup: value
+
+
+def names(value) -> set:
+    """
+    Returns the names of all the placeholders in a template value.
+    """
+    if isinstance(value, str):
+        return set(PLACEHOLDER.findall(value))
+    if isinstance(value, dict):
+        return set().union(*(names(k) | names(v) for k, v in value.items()))
+    if isinstance(value, list):
+        return set().union(*(names(v) for v in value))
+    return set()
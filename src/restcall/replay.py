@@ -0,0 +1,198 @@
+# MIT License
+# 
+# Copyright © 2022 Subhadip Ghosh
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the “Software”), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import glob
+import hashlib
+import http.server
+import json
+from os import path
+from typing import Final
+from urllib.parse import urlsplit
+
+SAVED_BODY_PREFIX: Final = 'Response has been saved to '
+# Headers describing the body as received, which the replayed body no longer matches
+SKIPPED_HEADERS: Final = {'content-length', 'content-encoding', 'transfer-encoding',
+        'connection', 'keep-alive'}
+
+
+def _target(url:str) -> str:
+    parts = urlsplit(url)
+    return (parts.path or '/') + ('?' + parts.query if parts.query else '')
+
+
+def body_hash(body) -> str:
+    """
+    Returns the hash of a request body as sent. JSON bodies are hashed in a
+    canonical form, so that the key order and the whitespace do not matter.
+    """
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    if isinstance(body, (bytes, bytearray)):
+        try:
+            body = json.loads(body)
+        except ValueError:
+            return hashlib.sha256(body).hexdigest()
+    if body in (None, '', b''):
+        return ''
+    canonical = json.dumps(body, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class _SavedBody:
+    """
+    A response body saved to a separate file, which is only opened while the
+    body is sent.
+    """
+
+    def __init__(self, filepath:str):
+        self.filepath = filepath
+        self.size = path.getsize(filepath)
+
+    def __len__(self) -> int:
+        return self.size
+
+
+def _saved_body(res_filepath:str, res_body:str):
+    # The body file path is relative to where restcall was run
+    saved = res_body[len(SAVED_BODY_PREFIX):]
+    for candidate in (saved, path.join(path.dirname(res_filepath), saved),
+            path.join(path.dirname(res_filepath), path.basename(saved))):
+        if path.isfile(candidate):
+            return _SavedBody(candidate)
+    print(f'WARN: Saved response body not found for {res_filepath}: {saved}')
+    return None
+
+
+def _body(res_filepath:str, template:dict):
+    res_body = template.get('resBody')
+    if isinstance(res_body, str) and res_body.startswith(SAVED_BODY_PREFIX):
+        return _saved_body(res_filepath, res_body)
+    if isinstance(res_body, str):
+        return res_body.encode('utf-8')
+    return json.dumps(res_body).encode('utf-8')
+
+
+def load_index(directory:str) -> dict:
+    """
+    Indexes the `-res.json` files under `directory` by HTTP method, URL path
+    and query, and request body hash. The bodies are encoded once, and the
+    bodies saved to separate files are read from them when they are sent.
+    """
+    index = {}
+    for res_filepath in sorted(glob.glob(path.join(directory, '**', '*-res.json'), recursive=True)):
+        try:
+            with open(res_filepath) as f:
+                template = json.load(f)
+            method = template['httpMethod']
+            target = _target(template['url'])
+            status = template['resStatus']
+        except (ValueError, KeyError) as e:
+            print(f'WARN: Skipping {res_filepath}: {e!r}')
+            continue
+        body = _body(res_filepath, template)
+        if body is None:
+            continue
+        headers = [(k, v) for k, v in template.get('resHeaders', {}).items()
+                if k.lower() not in SKIPPED_HEADERS]
+        entry = (status, headers, body)
+        # File payloads cannot be matched by content, so they match any body
+        payload = template.get('reqPayload')
+        if template.get('reqContentType') == 'application/json':
+            payload = json.dumps(payload)
+        if (template.get('reqContentType') not in ('application/zip', 'multipart/form-data')
+                and not template.get('reqPayloadFile')):
+            index[(method, target, body_hash(payload))] = entry
+        index.setdefault((method, target, None), entry)
+    return index
+
+
+class ReplayHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Small responses are not held back waiting for delayed ACKs
+    disable_nagle_algorithm = True
+
+    def _read_body(self) -> bytes:
+        if 'chunked' in self.headers.get('Transfer-Encoding', '').lower():
+            chunks = []
+            while size := int(self.rfile.readline().split(b';')[0], 16):
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+            # Skip the trailers
+            while self.rfile.readline() not in (b'\r\n', b'\n', b''):
+                pass
+            return b''.join(chunks)
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _replay(self):
+        request_body = self._read_body()
+        index = self.server.index
+        entry = (index.get((self.command, self.path, body_hash(request_body)))
+                or index.get((self.command, self.path, None)))
+        if entry is None:
+            status, headers, body = (404, [('Content-Type', 'application/json')],
+                    json.dumps({'error': f'No recorded response for {self.command} {self.path}'}).encode('utf-8'))
+        else:
+            status, headers, body = entry
+
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command == 'HEAD':
+            return
+        if isinstance(body, _SavedBody):
+            with open(body.filepath, 'rb') as f:
+                self.connection.sendfile(f, count=body.size)
+        else:
+            self.wfile.write(body)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = do_HEAD = _replay
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ReplayServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, index:dict):
+        self.index = index
+        super().__init__(address, ReplayHandler)
+
+
+def make_server(directory:str, host:str='127.0.0.1', port:int=8080) -> ReplayServer:
+    return ReplayServer((host, port), load_index(directory))
+
+
+def serve(directory:str, host:str='127.0.0.1', port:int=8080):
+    """
+    Serves the responses recorded in the `-res.json` files under `directory`
+    until interrupted.
+    """
+    server = make_server(directory, host, port)
+    count = sum(1 for key in server.index if key[2] is None)
+    print(f'Replaying {count} responses on http://{host}:{server.server_port}')
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
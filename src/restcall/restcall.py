@@ -25,14 +25,63 @@ import requests
 import base64
 import urllib3
 from restcall.curlify import to_curl
-from uncurl import api
-import importlib.metadata
+from restcall import tokencache
+from restcall import timing
+from restcall import httpcache
+from restcall import compression
+from restcall import retry
+from restcall import pagination
+from restcall import store
+from restcall import download
+from restcall import multipart
+from restcall import sink
+from restcall import metrics
+from restcall.timing import TimingAdapter
+import time
 import io
+import copy
+import contextlib
+import os
+import re
+import sys
+import threading
+from typing import Final
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+CHUNK_SIZE: Final = 64 * 1024
+HTTP_METHODS: Final = ['GET', 'POST', 'PUT', 'PATCH', 'DELETE']
+# Numbers with as many digits as the integers beyond 64 bits
+LONG_NUMBER: Final = re.compile(rb'\d{19}')
+# Number of parsed templates kept by the daemon
+TEMPLATE_CACHE_SIZE: Final = 1024
+
+# Write the response file without indentation
+compact_output = False
+# Save JSON response bodies to a sidecar file as received instead of parsing
+# them into the response file
+raw_json_output = False
+# Session used by the calls that are not given one, kept by the daemon so that
+# its connections stay open between calls
+shared_session = None
+# Parsed templates by file path, least recently used first, kept by the
+# daemon. None disables caching.
+template_cache = None
+_template_cache_lock = threading.Lock()
+
+
+class TemplateError(ValueError):
+    """
+    Raised when a template file cannot be found or parsed.
+    """
 
 
 def usage():
     return '''
-    restcall.py [-t] [-c] [-u] filepath
+    restcall.py [-t] [-c] [-u] [-b [-w WORKERS]] [--async] [--load] filepath
 
     Generate a template:
         restcall -t get-service-name.json
@@ -49,23 +98,118 @@ def usage():
         - reqAuthType - `none`, `bearer`, `bearer_generate`, `basic`
         - reqAuthToken
             - the actual token if the reqAuthType is `bearer`
-            - filepath to the restcall template to generate the token if the reqAuthType is `bearer_generate`
+            - filepath to the restcall template to generate the token if the reqAuthType is `bearer_generate`.
+              Generated tokens with an `expires_in` are cached until they are about to expire.
             - `username:password` if the reqAuthType is `basic`
         - reqContentType - the request content type. eg. `application/json`
         - reqHeaders - the request headers
         - reqPayload - the request body. If binary, provide the file path.
+          For `multipart/form-data`, the file path or an object of form fields
+          where values starting with `@` are file paths.
+        - reqPayloadFile - optional. A file sent as the request body as is,
+          without being parsed. `-` sends stdin with chunked encoding.
         - resFile - the file path for storing response externally
+        - reqCompress - optional. `gzip`, `br` or `zstd` to compress the request body
+        - reqTimeout - optional. Seconds to wait for the connection and for each read
+        - reqRetries - optional. Number of retries with backoff on errors, 429 and 5xx
+        - reqHedge - optional. Seconds, or a latency percentile like `p95`, after
+          which a duplicate GET, PUT or DELETE call is sent if there is no response yet
+        - resDownloadParts - optional. Number of parallel range requests for
+          large bodies saved to files, when the server accepts ranges
+        - resCache - optional. `true` to cache the response of a GET call and
+          revalidate it with `If-None-Match`/`If-Modified-Since` on later calls
+        - resPaginate - optional. Follow the pages of a JSON API and append them
+          to get-service-name-res.ndjson. eg. `{"next": "cursor", "cursorField":
+          "meta.next", "itemsField": "data", "maxPages": 10, "maxItems": 1000}`
 
     Make the REST call:
         restcall get-service-name.json
     
     The response will be stored in get-service-name-res.json.
 
+    Set a timeout, retries and hedging for all the calls:
+        restcall --timeout 10 --retries 3 --hedge p95 -b templates/
+
+    Write the response file without indentation, or save JSON response bodies
+    as received to get-service-name-body.json:
+        restcall --compact get-service-name.json
+        restcall --raw-json get-service-name.json
+
+    Store the response bodies saved to files once per content, hardlinked from
+    the response files, and remove the bodies no longer linked:
+        restcall --store ~/restcall-store get-service-name.json
+        restcall --store ~/restcall-store --gc
+
+    Download large bodies saved to files over 8 parallel range requests.
+    Interrupted downloads resume from the missing ranges:
+        restcall --download-parts 8 get-artifact.json
+
+    Append the results to one SQLite database or NDJSON file instead of a
+    response file per call:
+        restcall --sink results.sqlite -b templates/
+        restcall --sink results.ndjson -b templates/
+
+    Export the number and the latency of the calls by template, method, host
+    and status class to an OpenMetrics textfile or to StatsD:
+        restcall --metrics-file /var/lib/node_exporter/restcall.prom -b checks/
+        restcall --statsd localhost:8125 -b checks/
+
+    Cache the responses of all GET calls, or of none:
+        restcall --cache get-service-name.json
+        restcall --no-cache get-service-name.json
+
+    Reuse resolved addresses across runs and resume TLS sessions, then report
+    the cache hits and the resumed handshakes:
+        restcall --dns-cache --dns-ttl 300 --tls-resume get-service-name.json
+
+    Append the per-phase network timings of the call to a trace file:
+        restcall --trace trace.ndjson get-service-name.json
+
     Output equivalent curl command:
         restcall -c get-service-name.json
+
+    Generate templates in a directory from a HAR export of the browser
+    devtools or from a file with many curl commands:
+        restcall --import requests.har templates/
+        restcall --import curl-commands.txt templates/
+
+    Write the curl commands of all the templates in a directory to a script,
+    without making the calls. Bodies over 64K go to temp files:
+        restcall --curl-export calls.sh --curl-spill-size 64 templates/
+
+    Run all the templates in a directory (or matching a glob) concurrently:
+        restcall -b templates/
+        restcall -b -w 16 'templates/get-*.json'
+        restcall -b -w 64 --adaptive --rps 200 templates/
+
+    Run a workflow of templates, where each step runs once its dependencies
+    have succeeded:
+        restcall --workflow workflow.json
+
+    Call a template once for every row of a CSV or NDJSON file, filling in
+    its {{column}} placeholders. The results go to get-user-data.ndjson:
+        restcall --data users.csv get-user.json
+
+    Run a daemon that keeps connections, templates and tokens warm. Later
+    restcall commands are forwarded to it while it runs:
+        restcall --serve
+
+    Serve the responses recorded in the -res.json files of a directory from a
+    local stub server:
+        restcall --replay --port 8080 responses/
+
+    Use the asyncio engine for thousands of concurrent calls:
+        restcall -b --async -w 5000 --limit-per-host 200 templates/
+
+    Load test an endpoint by replaying a template:
+        restcall --load --requests 1000 --concurrency 10 get-service-name.json
+        restcall --load --duration 30 --concurrency 10 get-service-name.json
+
+    The report will be stored in get-service-name-load.json.
     '''
 
 def print_version():
+    import importlib.metadata
     return importlib.metadata.version('restcall')
 
 
@@ -88,9 +232,57 @@ def _write_template(res_filepath:str, template:dict):
         json.dump(template, f, indent=4)
 
 
-def _write_content(filepath:str, content:dict):
+def _write_response(res_filepath:str, template:dict):
+    if not compact_output:
+        _write_template(res_filepath, template)
+    else:
+        try:
+            content = orjson.dumps(template) if orjson else None
+        except TypeError:
+            # Integers beyond 64 bits
+            content = None
+        if content is None:
+            # The same output as orjson
+            content = json.dumps(template, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+        with open(res_filepath, 'wb') as f:
+            f.write(content)
+
+
+def _parse_json(res):
+    # orjson only decodes UTF-8, other encodings are left to requests. It
+    # reads integers beyond 64 bits as floats, so numbers that long are too.
+    if (orjson and (res.encoding or 'utf-8').lower() in ('utf-8', 'utf8')
+            and not LONG_NUMBER.search(res.content)):
+        try:
+            return orjson.loads(res.content)
+        except orjson.JSONDecodeError:
+            # Raised again by requests with its usual error
+            pass
+    return res.json()
+
+
+def _write_stream(filepath:str, res:requests.Response, parts:int=None, timeout=None) -> tuple:
+    """
+    Writes the response body to the file chunk by chunk so that the body is
+    never held fully in memory, or in `parts` parallel ranges made with the
+    `timeout` of the call when the server supports them. With a store the body is written there and linked to the
+    file. Returns the number of bytes written and the digest of the body,
+    which is None without a store.
+    """
+    if parts and parts > 1 and download.supports_ranges(res):
+        size = download.download(res, filepath, parts, new_session(parts), timeout)
+        return store.add(filepath) if store.directory else (size, None)
+    if store.directory:
+        return store.write(filepath, res.iter_content(CHUNK_SIZE))
+    size = 0
+    # The file may be a link to a body in the store, which must not change
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(filepath)
     with open(filepath, 'w+b') as f:
-        f.write(content)
+        for chunk in res.iter_content(CHUNK_SIZE):
+            f.write(chunk)
+            size += len(chunk)
+    return (size, None)
 
 
 def generate_template(filepath:str,
@@ -118,8 +310,19 @@ def generate_template(filepath:str,
 def uncurlify(inputfilepath:str, outputfilepath:str):
     with open(inputfilepath) as f:
         curl_command = ''.join(map(lambda l: l.removesuffix("\\\n"), f.readlines()))
-        curl_command = curl_command.replace('--location', '')
-        curl_command = curl_command.replace('--request', '-X')
+    _write_template(outputfilepath, curl_to_template(curl_command))
+
+
+def curl_to_template(curl_command:str) -> dict:
+    """
+    Returns the template for a curl command. Data that is not JSON is kept as
+    a string.
+    """
+    # Only needed here, so it is not imported for every call
+    from uncurl import api
+
+    curl_command = curl_command.replace('--location', '')
+    curl_command = curl_command.replace('--request', '-X')
 
     parse_context = api.parse_context(curl_command)
     authType, authToken = _extract_authorization(parse_context.headers)
@@ -130,22 +333,34 @@ def uncurlify(inputfilepath:str, outputfilepath:str):
         print("WARNING: Content-Type not found")
         content_type = ''
     headers_without_content_type = dict(filter(lambda x: x[0].lower() != "content-type", parse_context.headers.items()))
-    generate_template(outputfilepath,
-            parse_context.url,
-            parse_context.method.upper(),
-            authType,
-            authToken,
-            content_type,
-            headers_without_content_type,
-            json.loads(parse_context.data) if parse_context.data else "",
-            "")
+    return {
+            'url': parse_context.url,
+            'httpMethod': parse_context.method.upper(),
+            'reqAuthType': authType,
+            'reqAuthToken': authToken,
+            'reqContentType': content_type,
+            'reqHeaders': headers_without_content_type,
+            'reqPayload': _parse_data(parse_context.data),
+            'resFile': '',
+            }
+
+
+def _parse_data(data):
+    if not data:
+        return ""
+    try:
+        return json.loads(data)
+    except ValueError:
+        return data
 
 
 def _extract_authorization(headers: dict) -> tuple:
     authType = 'none'
     authToken = ''
-    if 'Authorization' in headers:
-        authorization = headers.pop('Authorization')
+    # Header names are case-insensitive, and HTTP/2 sends them in lower case
+    name = next((k for k in headers if k.lower() == 'authorization'), None)
+    if name:
+        authorization = headers.pop(name)
         if authorization.startswith('Basic '):
             authType = 'basic'
             authToken = str(base64.b64decode(authorization.removeprefix('Basic '), 'utf-8'))
@@ -157,33 +372,52 @@ def _extract_authorization(headers: dict) -> tuple:
 
 
 def _get_payload(template:dict):
-    data = None
-    files = None
-    if template['reqContentType'] == 'application/json':
-        data = json.dumps(template['reqPayload'])
+    payload = template['reqPayload']
+    if template.get('reqPayloadFile') == '-':
+        # stdin has no known length, so it is sent with chunked encoding
+        data = _read_chunks(sys.stdin.buffer)
+
+    elif template.get('reqPayloadFile'):
+        # Sent as is, without being parsed
+        data = open(template['reqPayloadFile'], 'rb')
+
+    elif hasattr(payload, '__next__'):
+        # Generators are sent with chunked encoding
+        data = payload
+
+    elif template['reqContentType'] == 'application/json':
+        data = json.dumps(payload)
 
     elif template['reqContentType'] == 'application/zip':
-        data = open(template['reqPayload'], 'rb')
+        data = open(payload, 'rb')
 
     elif template['reqContentType'] == 'multipart/form-data':
-        files = {'file': open(template['reqPayload'], 'rb')}
-        # Content-type is set by request
-        del template['reqContentType']
+        data = multipart.MultipartStream(multipart.form_fields(payload))
 
     else:
-        print(f'WARNING: Unsupported content type in the request: {template["reqContentType"]}. Operation might fail.')
-        data = template['reqPayload']
-    return (data, files)
+        # Requests without a body, like most GETs, need no content type
+        if payload:
+            print(f'WARNING: Unsupported content type in the request: {template["reqContentType"]}. Operation might fail.')
+        data = payload
+    return data
+
 
+def _read_chunks(f):
+    while chunk := f.read(CHUNK_SIZE):
+        yield chunk
 
-def _get_reqheaders(template:dict) -> dict:
-    req_headers=template['reqHeaders']
+
+def _get_reqheaders(template:dict, session:requests.Session=None) -> dict:
+    # The headers of this request only. The template is copied for other
+    # requests, like the next pages, which must not inherit them.
+    req_headers = dict(template['reqHeaders'])
 
     if template['reqAuthType'] == 'bearer':
         req_headers['Authorization'] = 'Bearer ' + template['reqAuthToken']
     elif template['reqAuthType'] == 'bearer_generate':
-        token_response = callrest(template['reqAuthToken'])
-        req_headers['Authorization'] = 'Bearer ' + token_response['resBody']['access_token']
+        token = tokencache.get_token(template['reqAuthToken'],
+                lambda: callrest(template['reqAuthToken'], session=session))
+        req_headers['Authorization'] = 'Bearer ' + token
     elif template['reqAuthType'] == 'basic':
         req_headers['Authorization'] = 'Basic ' + str(base64.b64encode(bytes(template['reqAuthToken'], 'utf-8')), 'utf-8')
 
@@ -193,24 +427,22 @@ def _get_reqheaders(template:dict) -> dict:
     return req_headers
 
 
-def _handle_external_response_file(template:dict, filepath:str, file_ext:str, content):
+def _handle_external_response_file(template:dict, filepath:str, file_ext:str, res) -> tuple:
     if template['resFile']:
         resfile = template['resFile']
     else:
         resfile = filepath[:-5] + file_ext
         template['resFile'] = resfile
-    _write_content(resfile, content)
-    return "Response has been saved to " + resfile
+    size, digest = _write_stream(resfile, res, download.get_parts(template),
+            retry.get_timeout(template))
+    return ("Response has been saved to " + resfile, size, digest)
 
 
 def _get_responsedata(res, template, filepath) -> dict:
     res_time = res.elapsed.total_seconds()
-    res_data = {
-            'resStatus': res.status_code,
-            'resHeaders': dict(res.headers),
-            'resSize': f'{len(res.content)/1024:.3f}K',
-            'resTime': f'{res_time}s'
-            }
+    # Set when the body is streamed to a file instead of being read in memory
+    size = None
+    digest = None
 
     content_type = res.headers['Content-Type'] if 'Content-Type' in res.headers else ""
 
@@ -221,87 +453,276 @@ def _get_responsedata(res, template, filepath) -> dict:
     # If the response file has been provided in the template always store it in
     # the file
     if template['resFile']:
-        res_data['resBody'] = _handle_external_response_file(template,
-                filepath, '', res.content)
+        res_body, size, digest = _handle_external_response_file(template,
+                filepath, '', res)
 
     # Otherwise try to intelligently handle different types of responses
     # Note: application/x-www-form-urlencoded' is added below to handle a
     # server side bug
+    elif content_type == 'application/json' and raw_json_output:
+        res_body, size, digest = _handle_external_response_file(template,
+                filepath, '-body.json', res)
+
     elif content_type == 'application/json' or content_type == 'application/x-www-form-urlencoded':
         try:
-            res_data['resBody'] = res.json()
+            res_body = _parse_json(res)
         except Exception as e:
             print("\nWARN: error while converting response to JSON. Using as text.")
-            res_data['resBody'] = res.text
+            res_body = res.text
 
     elif content_type == 'text/plain':
-        res_data['resBody'] = res.text
+        res_body = res.text
 
     elif content_type == 'application/pdf':
-        res_data['resBody'] = _handle_external_response_file(template,
-                filepath, '.pdf', res.content)
+        res_body, size, digest = _handle_external_response_file(template,
+                filepath, '.pdf', res)
 
     elif content_type == 'application/zip':
-        res_data['resBody'] = _handle_external_response_file(template,
-                filepath, '.zip', res.content)
+        res_body, size, digest = _handle_external_response_file(template,
+                filepath, '.zip', res)
     
     else: # Default handling
         print(f'Unsupported content type in response: {content_type}. Storing as text.')
-        res_data['resBody'] = res.text
+        res_body = res.text
 
+    if size is None:
+        size = len(res.content)
+    res_data = {
+            'resStatus': res.status_code,
+            'resHeaders': dict(res.headers),
+            'resSize': f'{size/1024:.3f}K',
+            'resTime': f'{res_time}s',
+            'resBody': res_body
+            }
+    if digest:
+        res_data['resBodyDigest'] = 'sha256:' + digest
     return res_data
 
 
-def _do_call(template:dict, filepath:str) -> requests.Response:
+def new_session(pool_size:int=10) -> requests.Session:
+    """
+    Returns a session whose connection pools are shared by all the calls made
+    through it. One pool is kept per host with up to `pool_size` connections.
+    """
+    session = requests.Session()
+    adapter = TimingAdapter(pool_connections=pool_size,
+            pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def _content_headers(req_headers:dict, data) -> dict:
+    # The content type of a multipart body carries its boundary, which is not
+    # kept in the template
+    if isinstance(data, multipart.MultipartStream):
+        return {**req_headers, 'Content-Type': data.content_type}
+    return req_headers
+
+
+def _compress_payload(template:dict, data, req_headers:dict) -> tuple:
+    encoding = template.get('reqCompress')
+    if encoding and isinstance(data, multipart.MultipartStream):
+        print('WARNING: Multipart request bodies are not compressed.')
+        return (data, None)
+    if encoding and data:
+        req_headers['Content-Encoding'] = encoding
+        return (compression.compress(data, encoding), encoding)
+    return (data, None)
+
+
+def _close_payload(data):
+    if isinstance(data, io.IOBase):
+        data.close()
+
+
+def _do_call(template:dict, filepath:str,
+        session:requests.Session=None) -> requests.Response:
     # Disabling warnings for unverified HTTPS requests
     # https://urllib3.readthedocs.io/en/1.26.x/advanced-usage.html#ssl-warnings
     urllib3.disable_warnings()
 
-    data, files = _get_payload(template)
+    # The cache key must be computed before the auth headers are added
+    cache_key = httpcache.cache_key(template) if httpcache.is_enabled(template) else None
+
+    data = _get_payload(template)
+    payload = data
+    req_headers = _get_reqheaders(template, session)
+    if cache_key:
+        req_headers.update(httpcache.validators(cache_key))
 
-    response = requests.request(template['httpMethod'],
+    data, encoding = _compress_payload(template, data, req_headers)
+
+    # Without a session every call opens a fresh connection
+    response = (session or requests).request(template['httpMethod'],
             template['url'],
-            headers=_get_reqheaders(template),
+            headers=_content_headers(req_headers, data),
             data=data,
-            files=files,
-            verify=False)
+            verify=False,
+            stream=True,
+            timeout=retry.get_timeout(template))
 
     # Close the open files
-    if isinstance(data, io.IOBase):
-        data.close()
-    if files:
-        for f in files.values():
-            f.close()
+    _close_payload(payload)
+
+    if cache_key:
+        response = httpcache.handle(cache_key, response)
+
+    # The curl command needs the body as it was before compression, and the
+    # paths of the files sent
+    response.payload = payload
+    response.payload_encoding = encoding
 
     return response
 
 
+def curlify_template(template:dict, embed:bool=False) -> str:
+    """
+    Returns the curl command for a template without making the call. Bodies
+    read from files are referred to by their path and are not read. Tokens
+    generated by a token template are not generated, the command has a
+    placeholder instead. With `embed`, binary and large inline bodies are
+    embedded in the command instead of being written to temp files.
+    """
+    if template['reqAuthType'] == 'bearer_generate':
+        template = {**retry.copy_template(template), 'reqAuthType': 'bearer',
+                'reqAuthToken': f'<token generated by {template["reqAuthToken"]}>'}
+    data = _get_payload(template)
+    try:
+        req_headers = _get_reqheaders(template)
+        encoding = template.get('reqCompress')
+        if encoding and data and not isinstance(data, multipart.MultipartStream):
+            req_headers['Content-Encoding'] = encoding
+        else:
+            encoding = None
+        request = requests.Request(template['httpMethod'], template['url'],
+                headers=_content_headers(req_headers, data), data=data).prepare()
+        return to_curl(request, verify=False, body=data, body_encoding=encoding, embed=embed)
+    finally:
+        _close_payload(data)
+
 
-def callrest(filepath:str, curlify:bool=False) -> dict[str,object]:
+def load_template(filepath:str) -> dict:
     try:
-        with open(filepath) as f:
-            template = json.load(f)
+        if template_cache is None:
+            with open(filepath) as f:
+                return json.load(f)
+        stat = os.stat(filepath)
+        key = path.abspath(filepath)
+        version = (stat.st_mtime_ns, stat.st_size)
+        with _template_cache_lock:
+            cached = template_cache.get(key)
+            if cached is not None and cached[0] == version:
+                template_cache.move_to_end(key)
+        # An edited template replaces the cached one
+        if cached is None or cached[0] != version:
+            with open(filepath) as f:
+                cached = (version, json.load(f))
+            with _template_cache_lock:
+                template_cache[key] = cached
+                template_cache.move_to_end(key)
+                while len(template_cache) > TEMPLATE_CACHE_SIZE:
+                    template_cache.popitem(last=False)
+        # The cached template is copied as the calls modify their template
+        return copy.deepcopy(cached[1])
+    except FileNotFoundError as e:
+        raise TemplateError(f"Error finding restcall file: {e.args[-1]}") from e
     except Exception as e:
-        if e is FileNotFoundError:
-            print(f"Error finding restcall file: {e.args[-1]}")
-        else:
-            print(f"Error parsing restcall file: {e.args[-1]}")
-        exit(1)
+        raise TemplateError(f"Error parsing restcall file: {e.args[-1]}") from e
 
-    if template['httpMethod'] in ['GET', 'POST', 'PUT', 'PATCH', 'DELETE']:
-        res = _do_call(template, filepath)
-    else:
+
+def callrest(filepath:str, curlify:bool=False,
+        session:requests.Session=None) -> dict[str,object]:
+    return call_template(load_template(filepath), filepath, curlify, session)
+
+
+def call_template(template:dict, filepath:str, curlify:bool=False,
+        session:requests.Session=None, row:int=None) -> dict[str,object]:
+    """
+    Makes the call of an already loaded template. The response is stored next
+    to `filepath` like for `callrest`. For the `row` of a data run, the files
+    saved are named after the row and the response data is returned without
+    writing the response file.
+    """
+    if template['httpMethod'] not in HTTP_METHODS:
         raise NotImplementedError('HTTP method not supported')
 
-    res_data = _get_responsedata(res, template, filepath)
+    session = session or shared_session
+    own_session = session is None
+    session = session or new_session(1)
+    start = time.perf_counter()
+    # Stays None when the call fails
+    status = None
+    try:
+        def fetch(page_template:dict):
+            return retry.call(page_template, lambda t: _do_call(t, filepath, session))
+
+        if template.get('resPaginate'):
+            res_data = pagination.paginate(template, _row_filepath(filepath, row), fetch)
+            result = _write_result(template, res_data, filepath, row)
+        else:
+            result = _store_response(fetch(template), template, filepath, curlify, row)
+        status = result['resStatus']
+        return result
+    finally:
+        metrics.observe(filepath, template, status, time.perf_counter() - start)
+        if own_session:
+            session.close()
+
 
+def _row_filepath(filepath:str, row:int) -> str:
+    return filepath if row is None else f'{filepath[:-5]}-{row}.json'
+
+
+def _write_result(template:dict, res_data:dict, filepath:str, row:int=None) -> dict[str,object]:
+    if row is not None:
+        return {'url': template['url'], 'httpMethod': template['httpMethod'], **res_data}
     template = { **template, **res_data }
-    res_filepath = filepath[:-5] + '-res.json'
-    _write_template(res_filepath, template)
+    if hasattr(template['reqPayload'], '__next__'):
+        template['reqPayload'] = '<streamed>'
+
+    if sink.current:
+        sink.current.put(sink.make_record(filepath, template))
+        res_filepath = sink.current.filepath
+    else:
+        res_filepath = filepath[:-5] + '-res.json'
+        _write_response(res_filepath, template)
     print('Response status: {}, size: {}, time: {}. Output stored in {}'.format(template['resStatus'],
         template['resSize'], template['resTime'], res_filepath))
+    return template
+
+
+def _store_response(res, template:dict, filepath:str, curlify:bool, row:int=None) -> dict[str,object]:
+    start = time.perf_counter()
+    try:
+        res_data = _get_responsedata(res, template, _row_filepath(filepath, row))
+    finally:
+        res.close()
+
+    if getattr(res, 'from_cache', False):
+        res_data['resCached'] = True
+
+    # Only the calls made through new_session() are timed per phase
+    phases = getattr(res, 'timings', None)
+    if phases:
+        phases.download = time.perf_counter() - start
+        res_data['resTiming'] = phases.to_dict()
+        timing.append_trace({
+            'timestamp': time.time(),
+            'template': filepath,
+            'url': res.url,
+            'httpMethod': res.request.method,
+            'resStatus': res.status_code,
+            **res_data['resTiming'],
+            })
+
+    template = _write_result(template, res_data, filepath, row)
 
     if curlify:
-        print(to_curl(res.request, verify=False))
+        print(to_curl(res.request,
+            compressed='Content-Encoding' in res.headers,
+            verify=False,
+            body=getattr(res, 'payload', None),
+            body_encoding=getattr(res, 'payload_encoding', None)))
 
     return template
@@ -0,0 +1,257 @@
+# MIT License
+# 
+# Copyright © 2022 Subhadip Ghosh
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the “Software”), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import asyncio
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from email.utils import parsedate_to_datetime
+from typing import Final
+from urllib.parse import urlsplit
+import requests
+from restcall.stats import LatencyHistogram
+
+BACKOFF_BASE: Final = 0.5
+BACKOFF_MAX: Final = 30.0
+IDEMPOTENT_METHODS: Final = ['GET', 'PUT', 'DELETE']
+# 429 means the request was not processed, so it is retried for any method
+RETRY_STATUSES: Final = [429, 502, 503, 504]
+# Latency percentiles are only trusted after this many calls to a host
+MIN_HEDGE_SAMPLES: Final = 20
+
+# Defaults for the templates without reqTimeout, reqRetries and reqHedge, set
+# from the command line
+timeout = None
+retries = 0
+hedge = None
+
+_latencies = {}
+_latencies_lock = threading.Lock()
+
+
+def get_timeout(template:dict):
+    value = template.get('reqTimeout', timeout)
+    # A [connect, read] pair is passed on as a tuple
+    return tuple(value) if isinstance(value, list) else value
+
+
+def backoff(attempt:int) -> float:
+    """
+    Exponential backoff with full jitter for the given retry attempt.
+    """
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+def retry_after(res:requests.Response):
+    """
+    Returns the delay in seconds asked for by the Retry-After header, if any.
+    """
+    value = res.headers.get('Retry-After')
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _record(url:str, seconds:float):
+    host = urlsplit(url).netloc
+    with _latencies_lock:
+        if host not in _latencies:
+            _latencies[host] = LatencyHistogram()
+        _latencies[host].record(seconds)
+
+
+def _hedge_delay(template:dict):
+    value = template.get('reqHedge', hedge)
+    if value is None or value is False:
+        return None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    # A percentile like "p95" of the latencies seen for the host so far
+    percentile = float(str(value).lstrip('p')) if value is not True else 95.0
+    with _latencies_lock:
+        histogram = _latencies.get(urlsplit(template['url']).netloc)
+        if histogram is None or histogram.count < MIN_HEDGE_SAMPLES:
+            return None
+        return histogram.percentile(percentile)
+
+
+def _timed(call, template:dict) -> requests.Response:
+    start = time.perf_counter()
+    res = call(template)
+    _record(template['url'], time.perf_counter() - start)
+    return res
+
+
+def _close_when_done(future):
+    future.add_done_callback(lambda f: f.exception() is None and f.result().close())
+
+
+def _hedged(call, template:dict, delay:float) -> requests.Response:
+    # The first call gets the template itself, so that its changes show up in
+    # the response file like for a single call
+    duplicate = copy_template(template)
+    executor = ThreadPoolExecutor(max_workers=2)
+    try:
+        first = executor.submit(_timed, call, template)
+        done, _ = wait([first], timeout=delay)
+        if done:
+            return first.result()
+        second = executor.submit(_timed, call, duplicate)
+        done, pending = wait([first, second], return_when=FIRST_COMPLETED)
+        succeeded = [future for future in done if future.exception() is None]
+        if succeeded:
+            winner = succeeded[0]
+        else:
+            # Fall back to the slower call if the faster one failed
+            winner = pending.pop() if pending else first
+            winner.result()
+        # The slower response is dropped once it arrives
+        for future in [first, second]:
+            if future is not winner:
+                _close_when_done(future)
+        return winner.result()
+    finally:
+        executor.shutdown(wait=False)
+
+
+def _policy(template:dict) -> tuple:
+    max_retries = int(template.get('reqRetries', retries))
+    idempotent = template['httpMethod'] in IDEMPOTENT_METHODS
+    # A body read from stdin or a generator can only be sent once
+    if template.get('reqPayloadFile') == '-' or hasattr(template.get('reqPayload'), '__next__'):
+        max_retries = 0
+        idempotent = False
+    return (max_retries, idempotent)
+
+
+def _retry_wait(res:requests.Response, attempt:int, idempotent:bool) -> tuple:
+    # Returns the reason and the time to wait before retrying the response,
+    # or None if it is final
+    if res.status_code not in RETRY_STATUSES or not (idempotent or res.status_code == 429):
+        return None
+    wait_time = retry_after(res)
+    if wait_time is None:
+        wait_time = backoff(attempt)
+    return (f'response status {res.status_code}', wait_time)
+
+
+def call(template:dict, do_call) -> requests.Response:
+    """
+    Makes the call with `do_call(template)`, retrying connection errors,
+    timeouts and retryable statuses with exponential backoff. Idempotent calls
+    can also be hedged: a duplicate is sent when the first call takes longer
+    than the hedge delay, and the first response wins.
+    """
+    max_retries, idempotent = _policy(template)
+    pristine = copy_template(template)
+
+    for attempt in range(max_retries + 1):
+        attempt_template = template if attempt == 0 else copy_template(pristine)
+        delay = _hedge_delay(attempt_template) if idempotent else None
+        try:
+            if delay is not None:
+                res = _hedged(do_call, attempt_template, delay)
+            else:
+                res = _timed(do_call, attempt_template)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            if attempt == max_retries or not idempotent:
+                raise
+            reason = type(e).__name__
+            wait_time = backoff(attempt)
+        else:
+            retry = _retry_wait(res, attempt, idempotent)
+            if retry is None or attempt == max_retries:
+                return res
+            reason, wait_time = retry
+            res.close()
+        print(f'WARN: Retrying {template["url"]} in {wait_time:.2f}s after {reason}.')
+        time.sleep(wait_time)
+
+
+async def _timed_async(call, template:dict) -> requests.Response:
+    start = time.perf_counter()
+    res = await call(template)
+    _record(template['url'], time.perf_counter() - start)
+    return res
+
+
+async def _hedged_async(call, template:dict, delay:float) -> requests.Response:
+    duplicate = copy_template(template)
+    first = asyncio.ensure_future(_timed_async(call, template))
+    done, _ = await asyncio.wait([first], timeout=delay)
+    if done:
+        return first.result()
+    second = asyncio.ensure_future(_timed_async(call, duplicate))
+    done, pending = await asyncio.wait([first, second], return_when=asyncio.FIRST_COMPLETED)
+    succeeded = [future for future in done if future.exception() is None]
+    if succeeded:
+        winner = succeeded[0]
+    else:
+        # Fall back to the slower call if the faster one failed
+        winner = pending.pop() if pending else first
+        await winner
+    # The slower response is dropped once it arrives
+    for future in [first, second]:
+        if future is not winner:
+            _close_when_done(future)
+    return winner.result()
+
+
+async def call_async(template:dict, do_call) -> requests.Response:
+    """
+    Asynchronous counterpart of `call`, where `do_call(template)` is a
+    coroutine.
+    """
+    max_retries, idempotent = _policy(template)
+    pristine = copy_template(template)
+
+    for attempt in range(max_retries + 1):
+        attempt_template = template if attempt == 0 else copy_template(pristine)
+        delay = _hedge_delay(attempt_template) if idempotent else None
+        try:
+            if delay is not None:
+                res = await _hedged_async(do_call, attempt_template, delay)
+            else:
+                res = await _timed_async(do_call, attempt_template)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            if attempt == max_retries or not idempotent:
+                raise
+            reason = type(e).__name__
+            wait_time = backoff(attempt)
+        else:
+            retry = _retry_wait(res, attempt, idempotent)
+            if retry is None or attempt == max_retries:
+                return res
+            reason, wait_time = retry
+            res.close()
+        print(f'WARN: Retrying {template["url"]} in {wait_time:.2f}s after {reason}.')
+        await asyncio.sleep(wait_time)
+
+
+def copy_template(template:dict) -> dict:
+    # A call sets fields of its template, like the resFile it saved the body to
+    return { **template, 'reqHeaders': dict(template['reqHeaders']) }
@@ -0,0 +1,172 @@
+# MIT License
+# 
+# Copyright © 2022 Subhadip Ghosh
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the “Software”), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import abc
+import json
+import queue
+import sqlite3
+import threading
+import time
+from typing import Final
+
+BATCH_SIZE: Final = 1000
+FLUSH_INTERVAL: Final = 0.5
+
+# The sink the results are written to instead of the -res.json files, set
+# with --sink. None writes the -res.json files.
+current = None
+
+
+def make_record(filepath:str, result:dict) -> dict:
+    """
+    Returns the record of a call: the template path, the request and all the
+    response fields, of which `resFile` refers to a body saved to a file.
+    """
+    return {
+            'timestamp': time.time(),
+            'template': filepath,
+            'url': result.get('url'),
+            'httpMethod': result.get('httpMethod'),
+            **{k: v for k, v in result.items() if k.startswith('res')},
+            }
+
+
+class Sink(abc.ABC):
+    """
+    Appends records to one file from a background thread, in batches, so
+    that many concurrent calls can record their results cheaply.
+    """
+
+    def __init__(self, filepath:str):
+        self.filepath = filepath
+        self._queue = queue.Queue()
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def put(self, record:dict):
+        if self._error:
+            raise self._error
+        self._queue.put(record)
+
+    def close(self):
+        """
+        Writes the pending records and closes the file.
+        """
+        self._queue.put(None)
+        self._thread.join()
+        if self._error:
+            raise self._error
+
+    def _run(self):
+        try:
+            self._open()
+            done = False
+            while not done:
+                batch = [self._queue.get()]
+                deadline = time.monotonic() + FLUSH_INTERVAL
+                while batch[-1] is not None and len(batch) < BATCH_SIZE:
+                    try:
+                        batch.append(self._queue.get(timeout=max(0, deadline - time.monotonic())))
+                    except queue.Empty:
+                        break
+                if batch[-1] is None:
+                    batch.pop()
+                    done = True
+                if batch:
+                    self._write(batch)
+        except Exception as e:
+            self._error = e
+        finally:
+            self._close()
+
+    @abc.abstractmethod
+    def _open(self):
+        pass
+
+    @abc.abstractmethod
+    def _write(self, records:list):
+        pass
+
+    @abc.abstractmethod
+    def _close(self):
+        pass
+
+
+class NdjsonSink(Sink):
+    """
+    Appends one JSON line per record.
+    """
+
+    def _open(self):
+        self._file = open(self.filepath, 'a')
+
+    def _write(self, records:list):
+        self._file.write(''.join(json.dumps(r) + '\n' for r in records))
+        self._file.flush()
+
+    def _close(self):
+        if getattr(self, '_file', None):
+            self._file.close()
+
+
+class SqliteSink(Sink):
+    """
+    Inserts the records into the `results` table. The status, URL and
+    template have their own columns, and the whole record is kept as JSON
+    for `json_extract`.
+    """
+
+    def _open(self):
+        self._db = sqlite3.connect(self.filepath)
+        # Concurrent readers do not block the writer
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('''CREATE TABLE IF NOT EXISTS results (
+                id INTEGER PRIMARY KEY,
+                timestamp REAL,
+                template TEXT,
+                url TEXT,
+                method TEXT,
+                status INTEGER,
+                record TEXT)''')
+        self._db.execute('CREATE INDEX IF NOT EXISTS results_template ON results (template)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS results_status ON results (status)')
+
+    def _write(self, records:list):
+        with self._db:
+            self._db.executemany('INSERT INTO results (timestamp, template, url, method, status, record) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    [(r['timestamp'], r['template'], r['url'], r['httpMethod'], r.get('resStatus'),
+                        json.dumps(r)) for r in records])
+
+    def _close(self):
+        if getattr(self, '_db', None):
+            self._db.close()
+
+
+def open_sink(filepath:str) -> Sink:
+    """
+    Opens a SQLite sink for `.sqlite` and `.db` files, an NDJSON sink otherwise.
+    """
+    if filepath.endswith(('.sqlite', '.sqlite3', '.db')):
+        return SqliteSink(filepath)
+    return NdjsonSink(filepath)
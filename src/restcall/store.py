@@ -0,0 +1,156 @@
+# MIT License
+# 
+# Copyright © 2022 Subhadip Ghosh
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the “Software”), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import hashlib
+import os
+import shutil
+import tempfile
+from os import path
+from restcall import diskcache
+
+# Directory of the content-addressed store, set with --store. None disables it.
+directory = None
+
+
+def blob_path(digest:str) -> str:
+    return path.join(directory, digest[:2], digest[2:])
+
+
+def _refs_path() -> str:
+    # Files that hold a copy of a stored body instead of a link, by digest
+    return path.join(directory, 'refs.json')
+
+
+def _hash(filepath:str) -> tuple:
+    digest = hashlib.sha256()
+    size = 0
+    with open(filepath, 'rb') as f:
+        while chunk := f.read(64 * 1024):
+            digest.update(chunk)
+            size += len(chunk)
+    return (size, digest.hexdigest())
+
+
+def _link(digest:str, filepath:str):
+    # Replaces the file atomically, also when it is a link to another blob
+    blob_filepath = blob_path(digest)
+    tmp_filepath = filepath + '.tmp'
+    try:
+        os.link(blob_filepath, tmp_filepath)
+    except FileExistsError:
+        os.remove(tmp_filepath)
+        os.link(blob_filepath, tmp_filepath)
+    except OSError:
+        # Hardlinks do not work across file systems. The copy does not count
+        # as a link of the blob, so it is recorded to keep the blob from gc.
+        print(f'WARN: Could not link {filepath} to the store, copying it instead.')
+        shutil.copyfile(blob_filepath, tmp_filepath)
+        refs = diskcache.read_json(_refs_path())
+        filepaths = refs.setdefault(digest, [])
+        if path.abspath(filepath) not in filepaths:
+            filepaths.append(path.abspath(filepath))
+            diskcache.write_json(_refs_path(), refs)
+    os.replace(tmp_filepath, filepath)
+
+
+def write(filepath:str, chunks) -> tuple:
+    """
+    Writes the chunks to the store, hashing them as they stream in, and links
+    `filepath` to the stored body. Identical bodies are stored once. Returns
+    the size and the SHA-256 digest of the body.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_filepath = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+                digest.update(chunk)
+                size += len(chunk)
+        digest = digest.hexdigest()
+        blob_filepath = blob_path(digest)
+        with diskcache.locked(path.join(directory, 'store.lock')):
+            if path.exists(blob_filepath):
+                os.remove(tmp_filepath)
+            else:
+                os.makedirs(path.dirname(blob_filepath), exist_ok=True)
+                # Stored bodies are shared by all their links, so none may change them
+                os.chmod(tmp_filepath, 0o444)
+                os.replace(tmp_filepath, blob_filepath)
+            _link(digest, filepath)
+    except BaseException:
+        if path.exists(tmp_filepath):
+            os.remove(tmp_filepath)
+        raise
+    return (size, digest)
+
+
+def add(filepath:str) -> tuple:
+    """
+    Moves an already written file to the store and links it back. A file on
+    another file system than the store is copied to it instead. Returns the
+    size and the SHA-256 digest of the file.
+    """
+    size, digest = _hash(filepath)
+    blob_filepath = blob_path(digest)
+    os.makedirs(path.dirname(blob_filepath), exist_ok=True)
+    with diskcache.locked(path.join(directory, 'store.lock')):
+        if not path.exists(blob_filepath):
+            try:
+                os.replace(filepath, blob_filepath)
+            except OSError:
+                tmp_filepath = blob_filepath + '.tmp'
+                shutil.copyfile(filepath, tmp_filepath)
+                os.replace(tmp_filepath, blob_filepath)
+            os.chmod(blob_filepath, 0o444)
+        _link(digest, filepath)
+    return (size, digest)
+
+
+def _referenced(refs:dict) -> dict:
+    # Drops the copies that were removed or no longer hold the body
+    return {digest: kept for digest, filepaths in refs.items()
+            if (kept := [f for f in filepaths if path.exists(f) and _hash(f)[1] == digest])}
+
+
+def gc() -> tuple:
+    """
+    Removes the stored bodies that no file links to or holds a copy of any
+    more. Returns the number of bodies removed and their size in bytes.
+    """
+    removed = 0
+    size = 0
+    with diskcache.locked(path.join(directory, 'store.lock')):
+        refs = _referenced(diskcache.read_json(_refs_path()))
+        diskcache.write_json(_refs_path(), refs)
+        for dirpath, _, filenames in os.walk(directory):
+            for filename in filenames:
+                filepath = path.join(dirpath, filename)
+                if dirpath == directory:
+                    continue
+                stat = os.stat(filepath)
+                if stat.st_nlink == 1 and path.basename(dirpath) + filename not in refs:
+                    os.remove(filepath)
+                    removed += 1
+                    size += stat.st_size
+    return (removed, size)
@@ -0,0 +1,168 @@
+# MIT License
+# 
+# Copyright © 2022 Subhadip Ghosh
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the “Software”), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import json
+import socket
+import threading
+import time
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import NewConnectionError
+from urllib3.util.connection import allowed_gai_family
+from restcall import netcache
+
+# Set to a file path to append the timings of every call to it
+trace_filepath = None
+
+_local = threading.local()
+_trace_lock = threading.Lock()
+
+
+class PhaseTimings:
+    """
+    Time spent in each phase of a call, in seconds. The connection phases are
+    zero when a pooled connection is reused.
+    """
+
+    def __init__(self):
+        self.dns = 0.0
+        self.connect = 0.0
+        self.tls = 0.0
+        self.ttfb = 0.0
+        self.download = 0.0
+
+    def to_dict(self) -> dict:
+        phases = {
+                'dns': self.dns,
+                'connect': self.connect,
+                'tls': self.tls,
+                'ttfb': self.ttfb,
+                'download': self.download,
+                }
+        phases['total'] = sum(phases.values())
+        return {k: round(v, 6) for k, v in phases.items()}
+
+
+def _current() -> PhaseTimings:
+    # Connections opened outside of a timed call are timed into a throwaway
+    return getattr(_local, 'timings', None) or PhaseTimings()
+
+
+def resolve(host:str, port:int) -> list:
+    return netcache.resolve(host, port, allowed_gai_family())
+
+
+class TimedHTTPConnection(HTTPConnection):
+
+    def _new_conn(self):
+        timings = _current()
+        start = time.perf_counter()
+        try:
+            addresses = resolve(self._dns_host, self.port)
+        except socket.gaierror as e:
+            raise NewConnectionError(self, "Failed to establish a new connection: %s" % e)
+        resolved = time.perf_counter()
+        timings.dns += resolved - start
+
+        # Connect to the resolved addresses in turn, so that urllib3 does not
+        # resolve the host again
+        dns_host = self._dns_host
+        try:
+            for i, address in enumerate(addresses):
+                self._dns_host = address[4][0]
+                try:
+                    conn = super()._new_conn()
+                    break
+                except NewConnectionError:
+                    if i == len(addresses) - 1:
+                        raise
+        finally:
+            self._dns_host = dns_host
+            timings.connect += time.perf_counter() - resolved
+        return conn
+
+
+class TimedHTTPSConnection(HTTPSConnection, TimedHTTPConnection):
+
+    def connect(self):
+        if netcache.tls_resume and self.ssl_context is None:
+            self.ssl_context = netcache.tls_context()
+        timings = _current()
+        start = time.perf_counter()
+        before = timings.dns + timings.connect
+        super().connect()
+        # The TLS handshake is the time connect() spent beyond _new_conn()
+        timings.tls += time.perf_counter() - start - (timings.dns + timings.connect - before)
+        netcache.record_handshake(self.sock)
+
+    def getresponse(self, *args, **kwargs):
+        response = super().getresponse(*args, **kwargs)
+        if netcache.tls_resume:
+            netcache.save_session(self.sock)
+        return response
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimingAdapter(HTTPAdapter):
+    """
+    Adapter that records the per-phase timings of every call in the
+    `timings` attribute of the response. The body download is timed by the
+    caller while it reads the body.
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+                'http': TimedHTTPConnectionPool,
+                'https': TimedHTTPSConnectionPool,
+                }
+
+    def send(self, request, *args, **kwargs):
+        timings = _local.timings = PhaseTimings()
+        start = time.perf_counter()
+        try:
+            response = super().send(request, *args, **kwargs)
+        finally:
+            _local.timings = None
+        # With stream=True send() returns once the headers have been parsed
+        timings.ttfb = time.perf_counter() - start - timings.dns - timings.connect - timings.tls
+        response.timings = timings
+        return response
+
+
+def append_trace(record:dict):
+    """
+    Appends the record to the trace file as one JSON line, if tracing is on.
+    """
+    if not trace_filepath:
+        return
+    line = json.dumps(record) + '\n'
+    with _trace_lock:
+        with open(trace_filepath, 'a') as f:
+            f.write(line)
@@ -0,0 +1,106 @@
+# MIT License
+# 
+# Copyright © 2022 Subhadip Ghosh
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the “Software”), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import hashlib
+import threading
+import time
+from os import path
+from typing import Final
+from restcall import diskcache
+
+# Tokens are refreshed this fraction of their lifetime before they expire,
+# but never less than MIN_REFRESH_MARGIN seconds before
+REFRESH_MARGIN: Final = 0.1
+MIN_REFRESH_MARGIN: Final = 30
+
+# Set to False to generate a new token for every call
+enabled = True
+
+_memory = {}
+_memory_lock = threading.Lock()
+
+
+def _cache_key(token_filepath:str) -> str:
+    # The template content is part of the key so that editing the token
+    # template invalidates the cached token
+    with open(token_filepath, 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    return path.abspath(token_filepath) + ':' + digest
+
+
+def _is_fresh(entry) -> bool:
+    return entry is not None and time.time() < entry['refreshAt']
+
+
+def get_token(token_filepath:str, generate) -> str:
+    """
+    Returns the bearer token generated by the token template. `generate` makes
+    the token call and returns its response data. Tokens whose response has an
+    `expires_in` field are cached in memory and on disk until shortly before
+    they expire, so that parallel restcall processes share them.
+    """
+    if not enabled:
+        return generate()['resBody']['access_token']
+
+    key = _cache_key(token_filepath)
+    with _memory_lock:
+        entry = _memory.get(key)
+    if _is_fresh(entry):
+        return entry['token']
+
+    directory = diskcache.cache_dir('tokens')
+    cache_filepath = path.join(directory, 'tokens.json')
+    tokens_lock = path.join(directory, 'tokens.lock')
+    # Holding the lock of the token while generating it makes concurrent
+    # callers wait for one token instead of all generating their own. Each
+    # token has its own lock, as generating a token may need another token.
+    key_lock = path.join(directory, hashlib.sha256(key.encode('utf-8')).hexdigest()[:16] + '.lock')
+    with diskcache.locked(key_lock):
+        with diskcache.locked(tokens_lock):
+            entry = diskcache.read_json(cache_filepath).get(key)
+        if not _is_fresh(entry):
+            token_body = generate()['resBody']
+            entry = {'token': token_body['access_token']}
+            expires_in = token_body.get('expires_in')
+            if not expires_in:
+                return entry['token']
+            expires_in = float(expires_in)
+            now = time.time()
+            entry['expiresAt'] = now + expires_in
+            entry['refreshAt'] = now + expires_in - max(expires_in * REFRESH_MARGIN,
+                    MIN_REFRESH_MARGIN)
+            with diskcache.locked(tokens_lock):
+                entries = diskcache.read_json(cache_filepath)
+                entries = {k: v for k, v in entries.items() if v['expiresAt'] > now}
+                entries[key] = entry
+                diskcache.write_json(cache_filepath, entries)
+
+    with _memory_lock:
+        _memory[key] = entry
+    return entry['token']
+
+
+def clear():
+    """
+    Drops the tokens cached in memory. The on-disk cache is left untouched.
+    """
+    with _memory_lock:
+        _memory.clear()
@@ -0,0 +1,138 @@
+# MIT License
+# 
+# Copyright © 2022 Subhadip Ghosh
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the “Software”), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import json
+import time
+from os import path
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from restcall import restcall
+from restcall import placeholders
+from restcall.placeholders import RENDERED_FIELDS
+
+
+def load_workflow(filepath:str) -> dict:
+    """
+    Loads the steps of a workflow file. Template paths are relative to the
+    workflow file. Besides the explicit `dependsOn`, a step depends on every
+    step its placeholders refer to.
+    """
+    with open(filepath) as f:
+        workflow = json.load(f)
+
+    steps = {}
+    for name, step in workflow['steps'].items():
+        template_filepath = path.join(path.dirname(filepath), step['template'])
+        template = restcall.load_template(template_filepath)
+        referred = {n.split('.')[0] for field in RENDERED_FIELDS
+                for n in placeholders.names(template.get(field))}
+        steps[name] = {
+                'template': template_filepath,
+                'dependsOn': set(step.get('dependsOn', [])) | referred,
+                }
+
+    for name, step in steps.items():
+        unknown = step['dependsOn'] - steps.keys()
+        if unknown:
+            raise ValueError(f'Step {name} depends on unknown steps: {", ".join(sorted(unknown))}')
+    _check_cycles(steps)
+    return steps
+
+
+def _check_cycles(steps:dict):
+    done = set()
+    remaining = dict(steps)
+    while remaining:
+        ready = [n for n, s in remaining.items() if s['dependsOn'] <= done]
+        if not ready:
+            raise ValueError(f'Cyclic dependencies between steps: {", ".join(sorted(remaining))}')
+        for name in ready:
+            done.add(name)
+            del remaining[name]
+
+
+def _lookup(results:dict):
+    def lookup(name:str):
+        step, *fields = name.split('.')
+        value = results[step]
+        for field in fields:
+            value = value[int(field)] if isinstance(value, list) else value[field]
+        return value
+    return lookup
+
+
+def _run_step(step:dict, results:dict, session, curlify:bool) -> dict:
+    template = restcall.load_template(step['template'])
+    lookup = _lookup(results)
+    for field in RENDERED_FIELDS:
+        if field in template:
+            template[field] = placeholders.compile_value(template[field])(lookup)
+    return restcall.call_template(template, step['template'], curlify, session)
+
+
+def run_workflow(filepath:str, workers:int=8, curlify:bool=False) -> dict:
+    """
+    Runs the steps of the workflow once each, as soon as the steps they depend
+    on have succeeded, with up to `workers` steps at a time. A step fails on
+    an error or a response status of 400 and above, and the steps depending on
+    it are skipped.
+    """
+    steps = load_workflow(filepath)
+    session = restcall.new_session(workers)
+    pending = dict(steps)
+    results = {}
+    failed = {}
+    running = {}
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while pending or running:
+            for name, step in list(pending.items()):
+                if step['dependsOn'] & failed.keys():
+                    failed[name] = 'skipped, a dependency failed'
+                    del pending[name]
+                elif step['dependsOn'] <= results.keys():
+                    running[executor.submit(_run_step, step, dict(results), session,
+                        curlify)] = name
+                    del pending[name]
+            if not running:
+                # Only skipped steps were left
+                continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    failed[name] = repr(e)
+                    continue
+                if result['resStatus'] >= 400:
+                    failed[name] = f'response status {result["resStatus"]}'
+                else:
+                    results[name] = result
+    elapsed = time.perf_counter() - start
+    session.close()
+
+    print('\nWorkflow finished: {} steps in {:.3f}s, succeeded: {}, failed: {}'.format(
+        len(steps), elapsed, len(results), len(failed)))
+    for name, reason in sorted(failed.items()):
+        print(f'FAILED: {name}: {reason}')
+    return {'results': results, 'failed': failed, 'time': elapsed}
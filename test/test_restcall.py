@@ -1,9 +1,25 @@
 #!/usr/bin/env python3
 
 import unittest
+import unittest.mock
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
 import pathlib
 import json
 import io
+import shutil
+import sqlite3
+import socket
+import ssl
+import subprocess
+import tempfile
+import threading
+import http.server
+import asyncio
+import glob
+import gzip
+import time
+import requests
 
 import httpretty
 from typing import Tuple
@@ -21,6 +37,160 @@ SRC_ROOT = os.path.abspath(
 sys.path.append(SRC_ROOT)
 
 from restcall.__main__ import _main as main
+from restcall import tokencache
+from restcall.stats import LatencyHistogram
+from restcall.limiter import AdaptiveLimiter, RateLimiter
+from restcall import aio
+from restcall import compression
+from restcall import multipart
+from restcall import daemon
+from restcall import replay
+from restcall import importer
+from restcall.timing import TimingAdapter
+from restcall import store
+from restcall import metrics
+from restcall import netcache
+from restcall import restcall
+
+
+RANGED_BODY = bytes(range(256)) * 4096
+PAGES_LAST_MODIFIED = 'Sat, 17 Oct 2026 10:00:00 GMT'
+
+
+class LocalHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = b'{"description": "A small command line script to invoke REST APIs"}'
+        self.server.paths.append(self.path)
+        if self.path == '/flaky' and self.server.paths.count('/flaky') < 3:
+            self.send_response(503)
+            self.send_header('Retry-After', '0')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.path == '/slow' or (self.path == '/slow-first' and self.server.paths.count('/slow-first') == 1):
+            time.sleep(1)
+        if self.path.startswith('/pages'):
+            if self.headers.get('If-Modified-Since') == PAGES_LAST_MODIFIED:
+                self.send_response(304)
+                self.send_header('Last-Modified', PAGES_LAST_MODIFIED)
+                self.end_headers()
+                return
+            page = int(self.path.partition('page=')[2] or 0)
+            body = json.dumps({'data': [page * 2, page * 2 + 1],
+                'next': page + 1 if page < 4 else None}).encode()
+        if self.path == '/ranged':
+            self.server.ranges.append(self.headers.get('Range'))
+            body = RANGED_BODY
+            if self.headers.get('Range'):
+                start, end = map(int, self.headers['Range'].removeprefix('bytes=').split('-'))
+                self.send_response(206)
+                self.send_header('Content-Range', f'bytes {start}-{end}/{len(body)}')
+                self.send_header('Content-Length', str(end - start + 1))
+                self.end_headers()
+                self.wfile.write(body[start:end + 1])
+                return
+            self.send_response(200)
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('ETag', '"r1"')
+            self.send_header('Content-Type', 'application/octet-stream')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        if self.path == '/etag':
+            self.server.conditional_requests.append(self.headers.get('If-None-Match'))
+            if self.headers.get('If-None-Match') == '"v1"':
+                self.send_response(304)
+                self.send_header('ETag', '"v1"')
+                self.end_headers()
+                return
+        self.send_response(200 if self.path != '/missing' else 404)
+        if self.path == '/etag':
+            self.send_header('ETag', '"v1"')
+        if self.path.startswith('/pages'):
+            self.send_header('Last-Modified', PAGES_LAST_MODIFIED)
+        if self.path.startswith('/pages') and json.loads(body)['next']:
+            self.send_header('Link', '</pages?page={}>; rel="next"'.format(json.loads(body)['next']))
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if self.headers.get('Transfer-Encoding') == 'chunked':
+            body = b''
+            while size := int(self.rfile.readline(), 16):
+                body += self.rfile.read(size)
+                self.rfile.readline()
+            self.rfile.readline()
+        else:
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.server.paths.append(self.path)
+        self.server.posts.append((self.headers, body))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'{}')
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_local_server(handler=LocalHandler) -> http.server.ThreadingHTTPServer:
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.conditional_requests = []
+    server.posts = []
+    server.paths = []
+    server.ranges = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class LocalAsyncServer:
+
+    def __init__(self):
+        self.connections = 0
+        self.requests = []
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        while request_line := await reader.readline():
+            headers = {}
+            while (line := await reader.readline()) != b'\r\n':
+                name, _, value = line.decode().partition(':')
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get('content-length', 0)))
+            self.requests.append((request_line.decode().split(' ')[:2], headers, body))
+            # Give the other calls a chance to open connections
+            await asyncio.sleep(0.01)
+            response_body = b'{"description": "A small command line script to invoke REST APIs"}'
+            writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n'
+                    b'Content-Length: %d\r\n\r\n%s' % (len(response_body), response_body))
+            await writer.drain()
+        writer.close()
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, '127.0.0.1', 0)
+        return self.server.sockets[0].getsockname()[1]
+
+
+def write_template(filepath:str, url:str, **overrides):
+    template = {
+            'url': url,
+            'httpMethod': 'GET',
+            'reqAuthType': 'none',
+            'reqAuthToken': '',
+            'reqContentType': '',
+            'reqHeaders': {},
+            'reqPayload': '',
+            'resFile': '',
+            **overrides
+            }
+    with open(filepath, 'w') as f:
+        json.dump(template, f)
 
 class TestRestcall(unittest.TestCase):
 
@@ -28,6 +198,22 @@ class TestRestcall(unittest.TestCase):
         self.files_to_remove = []
         self.maxDiff = None
 
+    def tearDown(self):
+        for f in self.files_to_remove:
+            if os.path.exists(f):
+                os.remove(f)
+
+    def start_server(self, handler=LocalHandler) -> http.server.ThreadingHTTPServer:
+        server = start_local_server(handler)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def make_work_dir(self) -> str:
+        work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, work_dir)
+        return work_dir
+
     def test_generate_template(self):
         filepath = '/tmp/get-test-generate-template.json'
         self.files_to_remove.append(filepath)
@@ -90,6 +276,64 @@ class TestRestcall(unittest.TestCase):
         self.assertEqual('{"description": "A small command line script to invoke REST APIs"}',
                 external_response)
 
+    @httpretty.activate(allow_net_connect=False)
+    def test_long_integers(self):
+        httpretty.register_uri(httpretty.GET, "http://restcall.org/",
+                           body='{"big": 18446744073709551616, "name": "caf\u00e9"}',
+                           content_type="application/json")
+        work_dir = self.make_work_dir()
+        filepath = os.path.join(work_dir, 'get-big.json')
+        write_template(filepath, 'http://restcall.org/')
+
+        for args in ([], ['--compact']):
+            main(args + [filepath])
+            with open(os.path.join(work_dir, 'get-big-res.json'), encoding='utf-8') as f:
+                self.assertEqual({'big': str(2 ** 64), 'name': 'caf\u00e9'},
+                        json.load(f, parse_int=str)['resBody'])
+
+    @httpretty.activate(allow_net_connect=False)
+    def test_get_compact_raw_json(self):
+        response_body = '{"description":  "A small command line script to invoke REST APIs"}'
+        httpretty.register_uri(httpretty.GET, "http://restcall.org/",
+                           body=response_body,
+                           content_type="application/json")
+
+        main(['--compact', '--raw-json', os.path.dirname(__file__) + '/fixtures/get-simple-rest.json'])
+
+        response_filepath = os.path.dirname(__file__) + '/fixtures/get-simple-rest-res.json'
+        self.files_to_remove.append(response_filepath)
+        body_filepath = os.path.dirname(__file__) + '/fixtures/get-simple-rest-body.json'
+        self.files_to_remove.append(body_filepath)
+        with open(response_filepath) as f:
+            actual = f.read()
+
+        self.assertNotIn('\n', actual)
+        self.assertEqual("Response has been saved to " + body_filepath, json.loads(actual)["resBody"])
+        with open(body_filepath) as f:
+            self.assertEqual(response_body, f.read())
+
+    @httpretty.activate(allow_net_connect=False)
+    def test_get_zip_streamed_to_file(self):
+        response_body = os.urandom(300 * 1024)
+        httpretty.register_uri(httpretty.GET, "http://restcall.org/",
+                           body=response_body,
+                           content_type="application/zip")
+
+        main([os.path.dirname(__file__) + '/fixtures/get-simple-rest.json'])
+
+        response_filepath = os.path.dirname(__file__) + '/fixtures/get-simple-rest-res.json'
+        self.files_to_remove.append(response_filepath)
+        zip_filepath = os.path.dirname(__file__) + '/fixtures/get-simple-rest.zip'
+        self.files_to_remove.append(zip_filepath)
+        with open(response_filepath) as f:
+            actual_response = json.load(f)
+
+        self.assertEqual(200, actual_response["resStatus"])
+        self.assertEqual('300.000K', actual_response["resSize"])
+        self.assertEqual(zip_filepath, actual_response["resFile"])
+        with open(zip_filepath, 'rb') as f:
+            self.assertEqual(response_body, f.read())
+
     @httpretty.activate(allow_net_connect=False)
     def test_multipart_file_upload(self):
         def httpretty_callback(request: HTTPrettyRequest,
@@ -198,10 +442,895 @@ class TestRestcall(unittest.TestCase):
 
         self.assertEqual(expected, actual)
 
-    def tearDown(self):
-        for f in self.files_to_remove:
-            if os.path.exists(f):
-                os.remove(f)
+    @httpretty.activate(allow_net_connect=False)
+    def test_batch(self):
+        response_body = '{"description": "A small command line script to invoke REST APIs"}'
+        httpretty.register_uri(httpretty.GET, "http://restcall.org/",
+                           body=response_body,
+                           content_type="application/json")
+
+        batch_dir = self.make_work_dir()
+        for name in ['get-first.json', 'get-second.json', 'get-third.json']:
+            shutil.copy(os.path.dirname(__file__) + '/fixtures/get-simple-rest.json',
+                    os.path.join(batch_dir, name))
+
+        capturedOutput = io.StringIO()
+        sys.stdout = capturedOutput
+
+        main(['-b', '-w', '2', batch_dir])
+
+        sys.stdout = sys.__stdout__
+
+        for name in ['get-first-res.json', 'get-second-res.json', 'get-third-res.json']:
+            with open(os.path.join(batch_dir, name)) as f:
+                actual_response = json.load(f)
+            self.assertEqual(200, actual_response["resStatus"])
+            self.assertEqual(response_body, json.dumps(actual_response["resBody"]))
+        self.assertIn('Batch finished: 3 templates', capturedOutput.getvalue())
+        self.assertIn('succeeded: 3, failed: 0', capturedOutput.getvalue())
+
+        # The files written by a run are not run as templates by the next one
+        capturedOutput = io.StringIO()
+        sys.stdout = capturedOutput
+        main(['--raw-json', '-b', batch_dir])
+        main(['-b', batch_dir])
+        sys.stdout = sys.__stdout__
+        self.assertTrue(os.path.exists(os.path.join(batch_dir, 'get-first-body.json')))
+        self.assertEqual(2, capturedOutput.getvalue().count('succeeded: 3, failed: 0'))
+
+        # An unreadable template fails on its own without ending the batch
+        broken_filepath = os.path.join(batch_dir, 'get-broken.json')
+        with open(broken_filepath, 'w') as f:
+            f.write('{')
+        capturedOutput = io.StringIO()
+        sys.stdout = capturedOutput
+        with self.assertRaises(SystemExit) as cm:
+            main(['-b', batch_dir])
+        self.assertEqual(1, cm.exception.code)
+        with self.assertRaises(SystemExit) as cm:
+            main([broken_filepath])
+        self.assertEqual(1, cm.exception.code)
+        sys.stdout = sys.__stdout__
+        self.assertIn('succeeded: 3, failed: 1', capturedOutput.getvalue())
+        self.assertIn('Error parsing restcall file', capturedOutput.getvalue())
+
+    @httpretty.activate(allow_net_connect=False)
+    def test_bearer_generate_token_cache(self):
+        work_dir = self.make_work_dir()
+        os.environ['RESTCALL_CACHE_DIR'] = os.path.join(work_dir, 'cache')
+        self.addCleanup(os.environ.pop, 'RESTCALL_CACHE_DIR')
+        self.addCleanup(tokencache.clear)
+
+        token_calls = []
+        def token_callback(request, url, headers):
+            token_calls.append(request)
+            return (200, headers, '{"access_token": "test-token", "expires_in": 3600}')
+        httpretty.register_uri(httpretty.POST, "http://restcall.org/token",
+                           body=token_callback,
+                           content_type="application/json")
+        httpretty.register_uri(httpretty.GET, "http://restcall.org/",
+                           body='{}',
+                           content_type="application/json")
+
+        token_filepath = os.path.join(work_dir, 'post-token.json')
+        with open(token_filepath, 'w') as f:
+            json.dump({'url': 'http://restcall.org/token', 'httpMethod': 'POST',
+                'reqAuthType': 'none', 'reqAuthToken': '', 'reqContentType': 'application/json',
+                'reqHeaders': {}, 'reqPayload': {}, 'resFile': ''}, f)
+        filepath = os.path.join(work_dir, 'get-with-token.json')
+        with open(filepath, 'w') as f:
+            json.dump({'url': 'http://restcall.org/', 'httpMethod': 'GET',
+                'reqAuthType': 'bearer_generate', 'reqAuthToken': token_filepath,
+                'reqContentType': 'application/json', 'reqHeaders': {},
+                'reqPayload': '', 'resFile': ''}, f)
+
+        main([filepath])
+        main([filepath])
+        # A new process only has the tokens persisted on disk
+        tokencache.clear()
+        main([filepath])
+
+        self.assertEqual(1, len(token_calls))
+        self.assertEqual('Bearer test-token',
+                httpretty.last_request().headers['Authorization'])
+
+        main(['--no-token-cache', filepath])
+        self.assertEqual(2, len(token_calls))
+
+        # Generating a token may need another token
+        tokencache.enabled = True
+        tokencache.clear()
+        shutil.rmtree(os.path.join(work_dir, 'cache'))
+        def generate_outer():
+            inner = tokencache.get_token(filepath,
+                    lambda: {'resBody': {'access_token': 'inner', 'expires_in': 3600}})
+            return {'resBody': {'access_token': 'outer-' + inner, 'expires_in': 3600}}
+        self.assertEqual('outer-inner', tokencache.get_token(token_filepath, generate_outer))
+
+    @httpretty.activate(allow_net_connect=False)
+    def test_workflow(self):
+        work_dir = self.make_work_dir()
+        login_calls = []
+        def login_callback(request, url, headers):
+            login_calls.append(request)
+            return (200, headers, '{"access_token": "test-token", "user": {"id": 42}}')
+        httpretty.register_uri(httpretty.POST, "http://restcall.org/login",
+                           body=login_callback,
+                           content_type="application/json")
+        httpretty.register_uri(httpretty.GET, "http://restcall.org/users/42",
+                           body='{"name": "restcall"}',
+                           content_type="application/json")
+        httpretty.register_uri(httpretty.GET, "http://restcall.org/users/42/orders",
+                           body='{"orders": []}',
+                           content_type="application/json")
+
+        write_template(os.path.join(work_dir, 'post-login.json'), 'http://restcall.org/login',
+                httpMethod='POST', reqContentType='application/json', reqPayload={})
+        write_template(os.path.join(work_dir, 'get-user.json'),
+                'http://restcall.org/users/{{login.resBody.user.id}}',
+                reqAuthType='bearer', reqAuthToken='{{login.resBody.access_token}}')
+        write_template(os.path.join(work_dir, 'get-orders.json'),
+                'http://restcall.org/users/{{login.resBody.user.id}}/orders',
+                reqAuthType='bearer', reqAuthToken='{{login.resBody.access_token}}')
+        workflow_filepath = os.path.join(work_dir, 'workflow.json')
+        with open(workflow_filepath, 'w') as f:
+            json.dump({'steps': {
+                'login': {'template': 'post-login.json'},
+                'user': {'template': 'get-user.json'},
+                'orders': {'template': 'get-orders.json', 'dependsOn': ['user']},
+                }}, f)
+
+        main(['--workflow', workflow_filepath])
+
+        self.assertEqual(1, len(login_calls))
+        self.assertEqual('Bearer test-token',
+                httpretty.last_request().headers['Authorization'])
+        self.assertEqual('/users/42/orders', httpretty.last_request().path)
+        with open(os.path.join(work_dir, 'get-user-res.json')) as f:
+            actual_response = json.load(f)
+        self.assertEqual('http://restcall.org/users/42', actual_response['url'])
+        self.assertEqual({'name': 'restcall'}, actual_response['resBody'])
+
+    def test_load(self):
+        server = self.start_server()
+        work_dir = self.make_work_dir()
+        filepath = os.path.join(work_dir, 'get-load.json')
+        write_template(filepath, 'http://127.0.0.1:{}/'.format(server.server_port))
+
+        capturedOutput = io.StringIO()
+        sys.stdout = capturedOutput
+
+        main(['--load', '--requests', '20', '--concurrency', '4', filepath])
+
+        sys.stdout = sys.__stdout__
+
+        with open(os.path.join(work_dir, 'get-load-load.json')) as f:
+            report = json.load(f)
+        self.assertEqual(20, report['requests'])
+        self.assertEqual({'200': 20}, report['statuses'])
+        self.assertEqual({}, report['errors'])
+        self.assertEqual(20, report['latency']['count'])
+        self.assertLessEqual(report['latency']['p50'], report['latency']['p99'])
+        self.assertLessEqual(report['latency']['p99'], report['latency']['max'])
+
+    def test_timing_trace(self):
+        server = self.start_server()
+        work_dir = self.make_work_dir()
+        filepath = os.path.join(work_dir, 'get-timing.json')
+        write_template(filepath, 'http://localhost:{}/'.format(server.server_port))
+        trace_filepath = os.path.join(work_dir, 'trace.ndjson')
+
+        main(['--trace', trace_filepath, filepath])
+        main(['--trace', trace_filepath, filepath])
+
+        with open(os.path.join(work_dir, 'get-timing-res.json')) as f:
+            actual_response = json.load(f)
+        timings = actual_response['resTiming']
+        self.assertEqual(['dns', 'connect', 'tls', 'ttfb', 'download', 'total'], list(timings))
+        self.assertGreater(timings['connect'], 0)
+        self.assertEqual(0, timings['tls'])
+        self.assertAlmostEqual(timings['total'], sum(v for k, v in timings.items() if k != 'total'),
+                places=5)
+
+        with open(trace_filepath) as f:
+            trace = [json.loads(line) for line in f]
+        self.assertEqual(2, len(trace))
+        self.assertEqual(filepath, trace[0]['template'])
+        self.assertEqual(200, trace[1]['resStatus'])
+        self.assertIn('ttfb', trace[1])
+
+    def test_conditional_cache(self):
+        server = self.start_server()
+        work_dir = self.make_work_dir()
+        os.environ['RESTCALL_CACHE_DIR'] = os.path.join(work_dir, 'cache')
+        self.addCleanup(os.environ.pop, 'RESTCALL_CACHE_DIR')
+        filepath = os.path.join(work_dir, 'get-etag.json')
+        write_template(filepath, 'http://127.0.0.1:{}/etag'.format(server.server_port),
+                resCache=True)
+        response_filepath = os.path.join(work_dir, 'get-etag-res.json')
+
+        main([filepath])
+        main([filepath])
+        with open(response_filepath) as f:
+            actual_response = json.load(f)
+        main(['--no-cache', filepath])
+
+        self.assertEqual([None, '"v1"', None], server.conditional_requests)
+        self.assertFalse([name for name in os.listdir(os.path.join(work_dir, 'cache', 'http'))
+                if name.endswith('.tmp')])
+        self.assertEqual(200, actual_response['resStatus'])
+        self.assertTrue(actual_response['resCached'])
+        self.assertEqual({'description': 'A small command line script to invoke REST APIs'},
+                actual_response['resBody'])
+
+        # Entries beyond the cache size are evicted right away
+        shutil.rmtree(os.path.join(work_dir, 'cache'))
+        main(['--cache-size', '0', filepath])
+        main(['--cache-size', '0', filepath])
+        self.assertEqual([None, '"v1"', None, None, None], server.conditional_requests)
+
+    def test_request_compression(self):
+        server = self.start_server()
+        work_dir = self.make_work_dir()
+        filepath = os.path.join(work_dir, 'post-compressed.json')
+        payload = {'items': ['value'] * 1000}
+        write_template(filepath, 'http://127.0.0.1:{}/'.format(server.server_port),
+                httpMethod='POST', reqContentType='application/json', reqPayload=payload,
+                reqCompress='gzip')
+
+        capturedOutput = io.StringIO()
+        sys.stdout = capturedOutput
+
+        main(['-c', filepath])
+
+        sys.stdout = sys.__stdout__
+
+        headers, body = server.posts[0]
+        self.assertEqual('gzip', headers['Content-Encoding'])
+        self.assertLess(len(body), len(json.dumps(payload)))
+        self.assertEqual(payload, json.loads(gzip.decompress(body)))
+        curl_command = "\n".join(capturedOutput.getvalue().split("\n")[1:])
+        self.assertTrue(curl_command.startswith("printf %s '{\"items\": "))
+        self.assertIn("| gzip -c | curl", curl_command)
+        self.assertIn("--data-binary @-", curl_command)
+
+    def test_daemon(self):
+        server = self.start_server()
+        work_dir = self.make_work_dir()
+        filepath = os.path.join(work_dir, 'get-daemon.json')
+        write_template(filepath, 'http://127.0.0.1:{}/'.format(server.server_port))
+        socket_filepath = os.path.join(work_dir, 'restcall.sock')
+        os.environ['RESTCALL_SOCKET'] = socket_filepath
+        self.addCleanup(os.environ.pop, 'RESTCALL_SOCKET')
+
+        self.assertIsNone(daemon.forward([filepath]))
+
+        daemon_server = daemon.make_server()
+        threading.Thread(target=daemon_server.serve_forever, daemon=True).start()
+        self.addCleanup(setattr, restcall, 'template_cache', None)
+        self.addCleanup(setattr, restcall, 'shared_session', None)
+        self.addCleanup(daemon_server.server_close)
+        self.addCleanup(daemon_server.shutdown)
+
+        capturedOutput = io.StringIO()
+        sys.stdout = capturedOutput
+
+        first_exit = daemon.forward([filepath])
+        second_exit = daemon.forward([filepath])
+        missing_exit = daemon.forward([os.path.join(work_dir, 'get-missing.json')])
+
+        sys.stdout = sys.__stdout__
+
+        self.assertEqual(0, first_exit)
+        self.assertEqual(0, second_exit)
+        self.assertEqual(1, missing_exit)
+        self.assertEqual(2, capturedOutput.getvalue().count('Response status: 200'))
+        self.assertEqual(1, len(restcall.template_cache))
+
+        # Only the client can read its stdin
+        stdin_filepath = os.path.join(work_dir, 'post-stdin.json')
+        write_template(stdin_filepath, 'http://127.0.0.1:{}/'.format(server.server_port),
+                httpMethod='POST', reqPayloadFile='-')
+        sys.stdout = capturedOutput = io.StringIO()
+        self.assertIsNone(daemon.forward([stdin_filepath]))
+        sys.stdout = sys.__stdout__
+        self.assertEqual('', capturedOutput.getvalue())
+        self.assertEqual([], server.posts)
+
+        # Commands run in their own process while the daemon is busy
+        with daemon._busy:
+            self.assertIsNone(daemon.forward([filepath]))
+
+        # An edited template replaces the cached one
+        write_template(filepath, 'http://127.0.0.1:{}/edited'.format(server.server_port))
+        sys.stdout = io.StringIO()
+        daemon.forward([filepath])
+        sys.stdout = sys.__stdout__
+        self.assertEqual(2, len(restcall.template_cache))
+        self.assertEqual('/edited', server.paths[-1])
+        self.assertTrue(pathlib.Path(os.path.join(work_dir, 'get-daemon-res.json')).is_file())
+
+    def test_retry_timeout_hedge(self):
+        server = self.start_server()
+        work_dir = self.make_work_dir()
+        url = 'http://127.0.0.1:{}'.format(server.server_port)
+
+        flaky_filepath = os.path.join(work_dir, 'get-flaky.json')
+        write_template(flaky_filepath, url + '/flaky', reqRetries=3)
+        main([flaky_filepath])
+        with open(os.path.join(work_dir, 'get-flaky-res.json')) as f:
+            self.assertEqual(200, json.load(f)['resStatus'])
+        self.assertEqual(3, server.paths.count('/flaky'))
+
+        slow_filepath = os.path.join(work_dir, 'get-slow.json')
+        write_template(slow_filepath, url + '/slow')
+        with self.assertRaises(SystemExit):
+            main(['--timeout', '0.2', slow_filepath])
+
+        hedged_filepath = os.path.join(work_dir, 'get-hedged.json')
+        write_template(hedged_filepath, url + '/slow-first', reqHedge=0.1)
+        start = time.perf_counter()
+        main([hedged_filepath])
+        self.assertLess(time.perf_counter() - start, 0.9)
+        self.assertEqual(2, server.paths.count('/slow-first'))
+        with open(os.path.join(work_dir, 'get-hedged-res.json')) as f:
+            self.assertEqual(200, json.load(f)['resStatus'])
+
+        write_template(slow_filepath, url + '/slow', reqTimeout=0.2, reqRetries=1)
+        with self.assertRaises(requests.exceptions.Timeout):
+            asyncio.run(aio.callrest_async(slow_filepath))
+        self.assertEqual(3, server.paths.count('/slow'))
+
+    def test_async_spooled_body(self):
+        server = self.start_server()
+        work_dir = self.make_work_dir()
+        filepath = os.path.join(work_dir, 'get-ranged.json')
+        write_template(filepath, 'http://127.0.0.1:{}/ranged'.format(server.server_port),
+                resFile=os.path.join(work_dir, 'ranged.bin'))
+        spools = []
+        spooled_file = tempfile.SpooledTemporaryFile
+
+        def spool(*args, **kwargs):
+            spools.append(spooled_file(*args, **kwargs))
+            return spools[-1]
+
+        with unittest.mock.patch('restcall.aio.SPOOL_SIZE', 64 * 1024), \
+                unittest.mock.patch('restcall.aio.tempfile.SpooledTemporaryFile',
+                        side_effect=spool):
+            asyncio.run(aio.callrest_async(filepath))
+        with open(os.path.join(work_dir, 'ranged.bin'), 'rb') as f:
+            self.assertEqual(RANGED_BODY, f.read())
+        # The body larger than the spool size went to a temporary file
+        self.assertEqual(1, len(spools))
+        self.assertTrue(spools[0]._rolled)
+
+    def test_adaptive_limiter(self):
+        limiter = AdaptiveLimiter(maximum=10)
+        for _ in range(30):
+            limiter.acquire()
+            limiter.release(0.01, 200)
+        self.assertGreater(limiter.limit, 5)
+        self.assertEqual(int(limiter.limit), limiter.peak)
+
+        peak = limiter.limit
+        limiter.acquire()
+        limiter.release(0.01, 429)
+        self.assertEqual(peak / 2, limiter.limit)
+
+        for _ in range(1000):
+            limiter.acquire()
+            limiter.release(0.01, 200)
+        self.assertEqual(10, limiter.limit)
+
+        # A slower host is not compared with the latency of a faster one
+        for _ in range(30):
+            limiter.acquire()
+            limiter.release(0.5, 200, 'http://slow.restcall.org/')
+        self.assertEqual(10, limiter.limit)
+
+    def test_rate_limiter(self):
+        rate_limiter = RateLimiter(20)
+        start = time.perf_counter()
+        for _ in range(30):
+            rate_limiter.wait('http://restcall.org/')
+        rate_limiter.wait('http://other.restcall.org/')
+        self.assertGreater(time.perf_counter() - start, 0.45)
+
+    def test_adaptive_batch(self):
+        server = self.start_server()
+        work_dir = self.make_work_dir()
+        for i in range(20):
+            write_template(os.path.join(work_dir, f'get-{i}.json'),
+                    'http://127.0.0.1:{}/'.format(server.server_port))
+
+        capturedOutput = io.StringIO()
+        sys.stdout = capturedOutput
+
+        main(['-b', '-w', '4', '--adaptive', '--rps', '1000', work_dir])
+
+        sys.stdout = sys.__stdout__
+
+        self.assertIn('succeeded: 20, failed: 0', capturedOutput.getvalue())
+        self.assertIn('Adaptive concurrency reached: ', capturedOutput.getvalue())
+
+        # The other runners do not limit their calls, so the options are refused
+        for options in (['-b', '--async'], ['--workflow'], ['--data', 'rows.csv'], []):
+            with self.assertRaises(SystemExit) as cm, \
+                    contextlib.redirect_stderr(io.StringIO()):
+                main([*options, '--rps', '10', work_dir])
+            self.assertEqual(2, cm.exception.code)
+
+    def test_latency_histogram(self):
+        histogram = LatencyHistogram()
+        for ms in range(1, 1001):
+            histogram.record(ms / 1000)
+
+        self.assertAlmostEqual(0.5, histogram.percentile(50), delta=0.005)
+        self.assertAlmostEqual(0.9, histogram.percentile(90), delta=0.009)
+        self.assertAlmostEqual(0.99, histogram.percentile(99), delta=0.0099)
+        self.assertEqual(1.0, histogram.max)
+        self.assertLess(len(histogram.buckets), 1000)
+
+    def test_async_batch(self):
+        work_dir = self.make_work_dir()
+        local_server = LocalAsyncServer()
+
+        async def run():
+            port = await local_server.start()
+            url = 'http://127.0.0.1:{}/'.format(port)
+            for i in range(10):
+                write_template(os.path.join(work_dir, f'get-{i}.json'), url + str(i))
+            write_template(os.path.join(work_dir, 'post-data.json'), url + 'data',
+                    httpMethod='POST', reqContentType='application/json',
+                    reqPayload={'key': 'value'})
+            try:
+                return await aio.callrest_batch_async(work_dir, concurrency=100,
+                        limit_per_host=2)
+            finally:
+                local_server.server.close()
+
+        capturedOutput = io.StringIO()
+        sys.stdout = capturedOutput
+
+        summary = asyncio.run(run())
+
+        sys.stdout = sys.__stdout__
+
+        self.assertEqual(11, summary['succeeded'])
+        self.assertEqual({200: 11}, summary['statuses'])
+        self.assertEqual(11, len(local_server.requests))
+        self.assertLessEqual(local_server.connections, 2)
+        post = [r for r in local_server.requests if r[0] == ['POST', '/data']][0]
+        self.assertEqual(b'{"key": "value"}', post[2])
+        self.assertEqual('application/json', post[1]['content-type'])
+        self.assertEqual(', '.join(compression.response_encodings()), post[1]['accept-encoding'])
+        decompress, flush = compression.decompressor('gzip')
+        self.assertEqual(b'restcall', decompress(gzip.compress(b'restcall')) + flush())
+        with open(os.path.join(work_dir, 'get-3-res.json')) as f:
+            actual_response = json.load(f)
+        self.assertEqual(200, actual_response['resStatus'])
+        self.assertEqual({'description': 'A small command line script to invoke REST APIs'},
+                actual_response['resBody'])
+
+    def test_pagination(self):
+        server = self.start_server()
+        work_dir = self.make_work_dir()
+        url = 'http://127.0.0.1:{}/pages'.format(server.server_port)
+
+        link_filepath = os.path.join(work_dir, 'get-link.json')
+        write_template(link_filepath, url, resPaginate={'itemsField': 'data'})
+        main([link_filepath])
+        with open(os.path.join(work_dir, 'get-link-res.ndjson')) as f:
+            self.assertEqual(list(range(10)), [json.loads(line) for line in f])
+        with open(os.path.join(work_dir, 'get-link-res.json')) as f:
+            res = json.load(f)
+        self.assertEqual(5, res['resPages'])
+        self.assertEqual(10, res['resItems'])
+
+        cursor_filepath = os.path.join(work_dir, 'get-cursor.json')
+        write_template(cursor_filepath, url, resPaginate={'next': 'cursor',
+            'cursorField': 'next', 'cursorParam': 'page', 'itemsField': 'data', 'maxItems': 5})
+        main([cursor_filepath])
+        with open(os.path.join(work_dir, 'get-cursor-res.ndjson')) as f:
+            self.assertEqual(list(range(5)), [json.loads(line) for line in f])
+        with open(os.path.join(work_dir, 'get-cursor-res.json')) as f:
+            self.assertEqual(3, json.load(f)['resPages'])
+
+        # Every page is revalidated with its own cached response
+        os.environ['RESTCALL_CACHE_DIR'] = os.path.join(work_dir, 'cache')
+        self.addCleanup(os.environ.pop, 'RESTCALL_CACHE_DIR')
+        cached_filepath = os.path.join(work_dir, 'get-cached.json')
+        write_template(cached_filepath, url, resCache=True, resPaginate={'itemsField': 'data'})
+        for _ in range(2):
+            main([cached_filepath])
+            with open(os.path.join(work_dir, 'get-cached-res.ndjson')) as f:
+                self.assertEqual(list(range(10)), [json.loads(line) for line in f])
+        with open(os.path.join(work_dir, 'get-cached-res.json')) as f:
+            self.assertEqual({}, json.load(f)['reqHeaders'])
+
+
+    def test_data_run(self):
+        server = self.start_server()
+        work_dir = self.make_work_dir()
+        filepath = os.path.join(work_dir, 'post-user.json')
+        write_template(filepath, 'http://127.0.0.1:{}/users/{{{{id}}}}'.format(server.server_port),
+                httpMethod='POST', reqContentType='application/json',
+                reqPayload={'id': '{{id}}', 'name': 'user {{name}}'},
+                resFile=os.path.join(work_dir, 'user.bin'))
+        data_filepath = os.path.join(work_dir, 'users.csv')
+        with open(data_filepath, 'w') as f:
+            f.write('id,name\n' + ''.join(f'{i},{i}\n' for i in range(20)))
+
+        capturedOutput = io.StringIO()
+        sys.stdout = capturedOutput
+
+        main(['--data', data_filepath, '-w', '4', filepath])
+
+        sys.stdout = sys.__stdout__
+
+        self.assertIn('succeeded: 20, failed: 0', capturedOutput.getvalue())
+        with open(os.path.join(work_dir, 'post-user-data.ndjson')) as f:
+            results = [json.loads(line) for line in f]
+        self.assertEqual(list(range(20)), sorted(r['row'] for r in results))
+        self.assertEqual({200}, {r['resStatus'] for r in results})
+        self.assertTrue(all(os.path.exists(os.path.join(work_dir, f'user-{i}.bin')) for i in range(20)))
+        self.assertEqual(sorted(f'/users/{i}' for i in range(20)), sorted(server.paths))
+        self.assertIn({'id': '7', 'name': 'user 7'}, [json.loads(body) for _, body in server.posts])
+
+
+    def test_replay(self):
+        server = self.start_server()
+        work_dir = self.make_work_dir()
+        url = 'http://127.0.0.1:{}'.format(server.server_port)
+        get_filepath = os.path.join(work_dir, 'get-service.json')
+        write_template(get_filepath, url + '/service?id=1')
+        file_filepath = os.path.join(work_dir, 'get-file.json')
+        write_template(file_filepath, url + '/file', resFile=os.path.join(work_dir, 'file.bin'))
+        post_filepath = os.path.join(work_dir, 'post-service.json')
+        write_template(post_filepath, url + '/service', httpMethod='POST',
+                reqContentType='application/json', reqPayload={'a': 1, 'b': 2})
+        text_filepath = os.path.join(work_dir, 'post-text.json')
+        write_template(text_filepath, url + '/text', httpMethod='POST',
+                reqContentType='text/plain', reqPayload='abc')
+        for filepath in (get_filepath, file_filepath, post_filepath, text_filepath):
+            main([filepath])
+
+        replay_server = replay.make_server(work_dir, port=0)
+        threading.Thread(target=replay_server.serve_forever, daemon=True).start()
+        self.addCleanup(replay_server.server_close)
+        self.addCleanup(replay_server.shutdown)
+        replay_url = 'http://127.0.0.1:{}'.format(replay_server.server_port)
+
+        res = requests.get(replay_url + '/service?id=1')
+        self.assertEqual(200, res.status_code)
+        self.assertEqual('A small command line script to invoke REST APIs', res.json()['description'])
+        res = requests.get(replay_url + '/file')
+        with open(os.path.join(work_dir, 'file.bin'), 'rb') as f:
+            self.assertEqual(f.read(), res.content)
+        res = requests.post(replay_url + '/service', data='{"b": 2, "a": 1}')
+        self.assertEqual({}, res.json())
+        self.assertIn(('POST', '/text', replay.body_hash(b'abc')), replay_server.index)
+        res = requests.post(replay_url + '/text', data=iter([b'ab', b'c']))
+        self.assertEqual({}, res.json())
+        self.assertEqual(404, requests.get(replay_url + '/unknown').status_code)
+
+
+    def test_store(self):
+        server = self.start_server()
+        work_dir = self.make_work_dir()
+        self.addCleanup(setattr, store, 'directory', None)
+        store_dir = os.path.join(work_dir, 'store')
+        url = 'http://127.0.0.1:{}/'.format(server.server_port)
+        for name in ('first', 'second'):
+            write_template(os.path.join(work_dir, f'get-{name}.json'), url,
+                    resFile=os.path.join(work_dir, f'{name}.bin'))
+            main(['--store', store_dir, os.path.join(work_dir, f'get-{name}.json')])
+
+        first = os.stat(os.path.join(work_dir, 'first.bin'))
+        self.assertEqual(first.st_ino, os.stat(os.path.join(work_dir, 'second.bin')).st_ino)
+        self.assertEqual(3, first.st_nlink)
+        with open(os.path.join(work_dir, 'get-first-res.json')) as f:
+            self.assertTrue(json.load(f)['resBodyDigest'].startswith('sha256:'))
+
+        main([os.path.join(work_dir, 'get-first.json')])
+        self.assertNotEqual(first.st_ino, os.stat(os.path.join(work_dir, 'first.bin')).st_ino)
+        self.assertEqual(2, os.stat(os.path.join(work_dir, 'second.bin')).st_nlink)
+
+        main(['--store', store_dir, '--gc'])
+        self.assertTrue(os.path.exists(os.path.join(work_dir, 'first.bin')))
+        os.remove(os.path.join(work_dir, 'first.bin'))
+        os.remove(os.path.join(work_dir, 'second.bin'))
+        capturedOutput = io.StringIO()
+        sys.stdout = capturedOutput
+        main(['--store', store_dir, '--gc'])
+        sys.stdout = sys.__stdout__
+        self.assertIn('Removed 1 unreferenced bodies', capturedOutput.getvalue())
+
+        # A copy made when the file cannot be linked keeps its body from gc
+        with unittest.mock.patch('restcall.store.os.link', side_effect=OSError):
+            main(['--store', store_dir, os.path.join(work_dir, 'get-first.json')])
+        self.assertEqual(1, os.stat(os.path.join(work_dir, 'first.bin')).st_nlink)
+        main(['--store', store_dir, '--gc'])
+        with open(os.path.join(work_dir, 'get-first-res.json')) as f:
+            digest = json.load(f)['resBodyDigest'].removeprefix('sha256:')
+        self.assertTrue(os.path.exists(os.path.join(store_dir, digest[:2], digest[2:])))
+        os.remove(os.path.join(work_dir, 'first.bin'))
+        main(['--store', store_dir, '--gc'])
+        self.assertFalse(os.path.exists(os.path.join(store_dir, digest[:2], digest[2:])))
+
+
+    def test_curl_file_bodies_and_export(self):
+        server = self.start_server()
+        work_dir = self.make_work_dir()
+        url = 'http://127.0.0.1:{}/upload'.format(server.server_port)
+        binary_filepath = os.path.join(work_dir, 'payload.zip')
+        with open(binary_filepath, 'wb') as f:
+            f.write(b'PK\x03\x04\xff\xfe' * 1000)
+        zip_filepath = os.path.join(work_dir, 'post-zip.json')
+        write_template(zip_filepath, url, httpMethod='POST',
+                reqContentType='application/zip', reqPayload=binary_filepath)
+        write_template(os.path.join(work_dir, 'post-form.json'), url, httpMethod='POST',
+                reqContentType='multipart/form-data', reqPayload=binary_filepath)
+        write_template(os.path.join(work_dir, 'post-large.json'), url, httpMethod='POST',
+                reqContentType='application/json', reqPayload={'items': ['x' * 100] * 100})
+
+        capturedOutput = io.StringIO()
+        sys.stdout = capturedOutput
+        main(['-c', zip_filepath])
+        sys.stdout = sys.__stdout__
+        self.assertIn('--data-binary @' + binary_filepath, capturedOutput.getvalue())
+
+        write_template(os.path.join(work_dir, 'get-token.json'), url,
+                reqAuthType='bearer_generate', reqAuthToken=os.path.join(work_dir, 'post-token.json'))
+
+        export_filepath = os.path.join(work_dir, 'calls.sh')
+        spilled = set(glob.glob(os.path.join(tempfile.gettempdir(), 'restcall-*.body')))
+        main(['--curl-export', export_filepath, '--curl-spill-size', '1', work_dir])
+        self.assertEqual(spilled, set(glob.glob(os.path.join(tempfile.gettempdir(), 'restcall-*.body'))))
+        with open(export_filepath) as f:
+            commands = f.read()
+        self.assertEqual(3, commands.count('-X POST'))
+        self.assertIn('-F file=@' + binary_filepath, commands)
+        self.assertNotIn('multipart/form-data', commands)
+        self.assertNotIn('x' * 100, commands)
+        self.assertIn('Authorization: Bearer <token generated by ' + os.path.join(work_dir, 'post-token.json'), commands)
+        self.assertEqual(1, len(server.posts))
+
+        subprocess.run(['sh', export_filepath], check=True, capture_output=True)
+        self.assertEqual(4, len(server.posts))
+        self.assertIn({'items': ['x' * 100] * 100}, [json.loads(body) for _, body in server.posts
+                if body.startswith(b'{')])
+
+
+    def test_import(self):
+        work_dir = self.make_work_dir()
+        har_filepath = os.path.join(work_dir, 'requests.har')
+        entries = [{'request': {'method': 'GET', 'url': f'https://restcall.org/api/users/{i % 50}',
+            'headers': [{'name': ':authority', 'value': 'restcall.org'},
+                {'name': 'authorization', 'value': 'Bearer abc'}]}} for i in range(100)]
+        entries.append({'request': {'method': 'POST', 'url': 'https://restcall.org/api/users',
+            'headers': [{'name': 'Content-Type', 'value': 'application/json'}],
+            'postData': {'mimeType': 'application/json', 'text': '{"name": "' + 'x' * 100 + '"}'}}})
+        # Responses spanning many chunks, with quotes, brackets and escapes in their strings
+        for i in range(0, 100, 10):
+            entries[i]['response'] = {'status': 200,
+                    'content': {'text': '{"a": ["\\"}]\\\\"]}' * (i + 20)}}
+        with open(har_filepath, 'w') as f:
+            json.dump({'log': {'version': '1.2', 'pages': [], 'entries': entries}}, f, indent=2)
+
+        with unittest.mock.patch('restcall.importer.READ_SIZE', 100):
+            self.assertEqual(entries, list(importer.iter_har_entries(har_filepath)))
+            main(['--import', har_filepath, '-w', '2', os.path.join(work_dir, 'har')])
+            # Only the requests are sent to the workers
+            with unittest.mock.patch('restcall.importer.ProcessPoolExecutor', ThreadPoolExecutor), \
+                    unittest.mock.patch('restcall.importer._convert',
+                            side_effect=importer._convert) as convert:
+                main(['--import', har_filepath, os.path.join(work_dir, 'har-threads')])
+            self.assertEqual(101, convert.call_count)
+            self.assertEqual([], [c for c in convert.call_args_list if 'response' in c.args[0][1]])
+        self.assertEqual(51, len(os.listdir(os.path.join(work_dir, 'har'))))
+        with open(os.path.join(work_dir, 'har', 'get-api-users-7.json')) as f:
+            template = json.load(f)
+        self.assertEqual('bearer', template['reqAuthType'])
+        self.assertEqual('abc', template['reqAuthToken'])
+        self.assertEqual({}, template['reqHeaders'])
+        with open(os.path.join(work_dir, 'har', 'post-api-users.json')) as f:
+            self.assertEqual({'name': 'x' * 100}, json.load(f)['reqPayload'])
+
+        curl_filepath = os.path.join(work_dir, 'commands.txt')
+        with open(curl_filepath, 'w') as f:
+            f.write("curl 'https://restcall.org/api/items' \\\n  -H 'Accept: application/json'\n\n"
+                    "curl -X POST 'https://restcall.org/api/items' -H 'Content-Type: text/plain' --data 'plain text'\n"
+                    "curl 'https://restcall.org/api/items'\n")
+        main(['--import', curl_filepath, os.path.join(work_dir, 'curl')])
+        self.assertEqual(['get-api-items.json', 'post-api-items.json'],
+                sorted(os.listdir(os.path.join(work_dir, 'curl'))))
+        with open(os.path.join(work_dir, 'curl', 'post-api-items.json')) as f:
+            self.assertEqual('plain text', json.load(f)['reqPayload'])
+
+
+    def test_ranged_download(self):
+        server = self.start_server()
+        work_dir = self.make_work_dir()
+        filepath = os.path.join(work_dir, 'get-artifact.json')
+        artifact_filepath = os.path.join(work_dir, 'artifact.bin')
+        write_template(filepath, 'http://127.0.0.1:{}/ranged'.format(server.server_port),
+                resFile=artifact_filepath, resDownloadParts=4, reqTimeout=7)
+
+        send = TimingAdapter.send
+        with unittest.mock.patch('restcall.download.PART_SIZE', 100 * 1024), \
+                unittest.mock.patch('restcall.timing.TimingAdapter.send', autospec=True,
+                        side_effect=send) as mock_send:
+            main([filepath])
+            with open(artifact_filepath, 'rb') as f:
+                self.assertEqual(RANGED_BODY, f.read())
+            self.assertEqual(11, len([r for r in server.ranges if r]))
+            # The ranges are fetched through the timed adapter, with the
+            # timeout of the template
+            self.assertEqual(12, mock_send.call_count)
+            self.assertEqual({7}, {c.kwargs['timeout'] for c in mock_send.call_args_list})
+            self.assertFalse(os.path.exists(artifact_filepath + '.ranges.json'))
+
+            # An interrupted download resumes from the missing ranges
+            server.ranges.clear()
+            with open(artifact_filepath + '.part', 'wb') as f:
+                f.write(RANGED_BODY[:300 * 1024] + bytes(len(RANGED_BODY) - 300 * 1024))
+            with open(artifact_filepath + '.ranges.json', 'w') as f:
+                json.dump({'url': 'http://127.0.0.1:{}/ranged'.format(server.server_port),
+                    'size': len(RANGED_BODY), 'validator': '"r1"',
+                    'done': [[i * 100 * 1024, (i + 1) * 100 * 1024 - 1] for i in range(3)]}, f)
+            main([filepath])
+            with open(artifact_filepath, 'rb') as f:
+                self.assertEqual(RANGED_BODY, f.read())
+            self.assertEqual(8, len([r for r in server.ranges if r]))
+            self.assertNotIn('bytes=0-102399', server.ranges)
+
+            # The downloaded file is moved to the store and linked back
+            self.addCleanup(setattr, store, 'directory', None)
+            main(['--store', os.path.join(work_dir, 'store'), filepath])
+            with open(artifact_filepath, 'rb') as f:
+                self.assertEqual(RANGED_BODY, f.read())
+            self.assertEqual(2, os.stat(artifact_filepath).st_nlink)
+
+
+    def test_streaming_uploads(self):
+        server = self.start_server()
+        work_dir = self.make_work_dir()
+        url = 'http://127.0.0.1:{}/upload'.format(server.server_port)
+        for name in ('a.txt', 'b.bin'):
+            with open(os.path.join(work_dir, name), 'wb') as f:
+                f.write(name.encode() * 10000)
+
+        form_filepath = os.path.join(work_dir, 'post-form.json')
+        write_template(form_filepath, url, httpMethod='POST', reqContentType='multipart/form-data',
+                reqPayload={'files': ['@' + os.path.join(work_dir, 'a.txt'), '@' + os.path.join(work_dir, 'b.bin')],
+                    'description': 'two files'})
+        main([form_filepath])
+        headers, body = server.posts[-1]
+        self.assertEqual(str(len(body)), headers['Content-Length'])
+        boundary = headers['Content-Type'].split('boundary=')[1].encode()
+        self.assertEqual(4, body.count(boundary))
+        self.assertIn(b'filename="b.bin"\r\nContent-Type: application/octet-stream\r\n\r\n' + b'b.bin' * 10000, body)
+        self.assertIn(b'name="description"\r\n\r\ntwo files\r\n', body)
+        with open(os.path.join(work_dir, 'post-form-res.json')) as f:
+            self.assertEqual('multipart/form-data', json.load(f)['reqContentType'])
+        with multipart.MultipartStream([('description', 'two files')]) as stream:
+            self.assertEqual(0, stream.readinto(bytearray()))
+
+        json_filepath = os.path.join(work_dir, 'large.json')
+        with open(json_filepath, 'w') as f:
+            f.write('{"b": 1,   "a": [1, 2]}')
+        file_filepath = os.path.join(work_dir, 'post-file.json')
+        write_template(file_filepath, url, httpMethod='POST', reqContentType='application/json',
+                reqPayloadFile=json_filepath)
+        main([file_filepath])
+        self.assertEqual(b'{"b": 1,   "a": [1, 2]}', server.posts[-1][1])
+
+        template = restcall.load_template(file_filepath)
+        del template['reqPayloadFile']
+        template['reqPayload'] = (b'chunk %d,' % i for i in range(3))
+        restcall.call_template(template, file_filepath)
+        headers, body = server.posts[-1]
+        self.assertEqual('chunked', headers['Transfer-Encoding'])
+        self.assertEqual(b'chunk 0,chunk 1,chunk 2,', body)
+
+
+    def test_sink(self):
+        server = self.start_server()
+        work_dir = self.make_work_dir()
+        url = 'http://127.0.0.1:{}'.format(server.server_port)
+        for i in range(20):
+            write_template(os.path.join(work_dir, f'get-{i}.json'), url + ('/missing' if i < 5 else '/'))
+
+        sqlite_filepath = os.path.join(work_dir, 'results.sqlite')
+        main(['--sink', sqlite_filepath, '-b', '-w', '4', os.path.join(work_dir, 'get-*.json')])
+        with sqlite3.connect(sqlite_filepath) as db:
+            self.assertEqual([(200, 15), (404, 5)], db.execute(
+                'SELECT status, count(*) FROM results GROUP BY status ORDER BY status').fetchall())
+            body, = db.execute("SELECT json_extract(record, '$.resBody.description') FROM results "
+                    "WHERE template LIKE '%get-7.json'").fetchone()
+        self.assertEqual('A small command line script to invoke REST APIs', body)
+        self.assertFalse(os.path.exists(os.path.join(work_dir, 'get-7-res.json')))
+
+        ndjson_filepath = os.path.join(work_dir, 'results.ndjson')
+        main(['--sink', ndjson_filepath, os.path.join(work_dir, 'get-7.json')])
+        main(['--sink', ndjson_filepath, os.path.join(work_dir, 'get-8.json')])
+        with open(ndjson_filepath) as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual([200, 200], [r['resStatus'] for r in records])
+        self.assertEqual(os.path.join(work_dir, 'get-8.json'), records[1]['template'])
+
+
+    def test_metrics(self):
+        server = self.start_server()
+        work_dir = self.make_work_dir()
+        self.addCleanup(metrics.reset)
+        self.addCleanup(metrics.callbacks.clear)
+        url = 'http://127.0.0.1:{}'.format(server.server_port)
+        for i in range(6):
+            write_template(os.path.join(work_dir, f'get-{i}.json'), url + ('/missing' if i < 2 else '/'))
+        statsd_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        statsd_socket.bind(('127.0.0.1', 0))
+        statsd_socket.settimeout(5)
+        self.addCleanup(statsd_socket.close)
+        observations = []
+        metrics.add_callback(observations.append)
+
+        metrics_filepath = os.path.join(work_dir, 'restcall.prom')
+        main(['--metrics-file', metrics_filepath, '--statsd', '127.0.0.1:{}'.format(statsd_socket.getsockname()[1]),
+            '-b', os.path.join(work_dir, 'get-*.json')])
+
+        with open(metrics_filepath) as f:
+            textfile = f.read()
+        labels = 'template="{}",method="GET",host="127.0.0.1",status_class="4xx"'.format(
+                os.path.join(work_dir, 'get-0.json'))
+        self.assertIn(f'restcall_requests_total{{{labels}}} 1\n', textfile)
+        self.assertIn(f'restcall_request_duration_seconds_bucket{{{labels},le="+Inf"}} 1\n', textfile)
+        self.assertTrue(textfile.endswith('# EOF\n'))
+        datagram = statsd_socket.recv(65536).decode()
+        self.assertEqual(6, datagram.count('restcall.requests:1|c|#'))
+        self.assertEqual(6, datagram.count('|ms|#'))
+        self.assertEqual(['2xx'] * 4 + ['4xx'] * 2, sorted(o['statusClass'] for o in observations))
+
+
+    def test_dns_cache_and_tls_resume(self):
+        work_dir = self.make_work_dir()
+        cert_filepath = os.path.join(work_dir, 'cert.pem')
+        key_filepath = os.path.join(work_dir, 'key.pem')
+        subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+            '-subj', '/CN=localhost', '-keyout', key_filepath, '-out', cert_filepath],
+            check=True, capture_output=True)
+        server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), LocalHandler)
+        server.paths = []
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert_filepath, key_filepath)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        os.environ['RESTCALL_CACHE_DIR'] = work_dir
+        self.addCleanup(os.environ.pop, 'RESTCALL_CACHE_DIR')
+        self.addCleanup(setattr, netcache, 'dns_ttl', None)
+        self.addCleanup(setattr, netcache, 'tls_resume', False)
+        self.addCleanup(setattr, netcache, '_dns', None)
+        self.addCleanup(netcache._sessions.clear)
+        filepath = os.path.join(work_dir, 'get-tls.json')
+        write_template(filepath, 'https://localhost:{}/'.format(server.server_port))
+
+        reports = []
+        for _ in range(2):
+            # The second run reads the addresses from disk like a new process
+            netcache._dns = None
+            capturedOutput = io.StringIO()
+            sys.stdout = capturedOutput
+            main(['--dns-cache', '--tls-resume', filepath])
+            sys.stdout = sys.__stdout__
+            reports.append(capturedOutput.getvalue())
+
+        self.assertIn('Response status: 200', reports[1])
+        self.assertIn('DNS cache: 0 hits, 1 misses. TLS handshakes: 0 resumed, 1 full', reports[0])
+        self.assertIn('DNS cache: 1 hits, 0 misses. TLS handshakes: 1 resumed, 0 full', reports[1])
+
 
 if __name__=='__main__':
     unittest.main()